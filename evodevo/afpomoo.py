@@ -13,35 +13,110 @@
 # limitations under the License.
 
 
-import copy
-import random
+import pickle
+
+import numpy as np
 
 try:
     from parallelpy.parallel_evaluate import batch_complete_work
     from parallelpy.parallel_evaluate import cleanup as _cleanup
     ParallelPyMissing = False
 except ImportError:
-    from multiprocessing import Pool
     ParallelPyMissing = True
 
+from evodevo.evaluation import PoolEvaluator, complete_steps
+from evodevo.metrics import front_metrics
 from evodevo.moo_interfaces import RobotInterface
+from evodevo.population_table import PopulationTable
+from evodevo.rng import RNGStreams, seeded
+from evodevo.scheduling import MakespanScheduler
+from evodevo.work import ReproductionWork, TimedWork, make_child
+from evodevo.utils.memory_utils import current_rss
 from evodevo.utils.print_utils import print_all
 
 
+class FrontRobots(object):
+    """
+    Read-only list of the dominating robots of a generation. The robots are looked up by id when they are accessed, so
+    spilled robots are only loaded if they are used. See AFPOMoo.get_student
+    """
+
+    def __init__(self, population, ids):
+        self.population = population
+        self.ids = list(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self.population.get_student(robot_id) for robot_id in self.ids[k]]
+        return self.population.get_student(self.ids[k])
+
+    def __iter__(self):
+        return (self.population.get_student(robot_id) for robot_id in self.ids)
+
+
 class AFPOMoo(object):
-    def __init__(self, robot_factory, pop_size=50, messages_file=None):
-        assert isinstance(robot_factory(), RobotInterface), 'robot_factory needs to produce robots which' \
-                                                               'conform to the RobotInterface interface'
+    def __init__(self, robot_factory, pop_size=50, messages_file=None, remote_reproduction=False, seed=None,
+                 eval_slots=None, deadlines=None, max_resident=None, robot_store=None, hv_reference=None,
+                 archive=None):
+        """
+        :param robot_factory: Function which returns a new robot.
+        :param pop_size: Number of robots which survive each generation.
+        :param messages_file: Unused.
+        :param remote_reproduction: If True, children are cloned, mutated and evaluated on the workers. The parent is
+            pickled once per child, not once per parent. See ReproductionWork
+        :param seed: Seed of the selection, immigrant and offspring random number streams. See RNGStreams
+        :param eval_slots: Number of cpu slots of the evaluation backend. See MakespanScheduler. If None, it is taken
+            from the local PoolEvaluator when parallelpy is missing; with parallelpy (e.g. over MPI) the number of
+            slots is not known here, so pass it to get a predicted makespan.
+        :param deadlines: EvaluationDeadlines deciding the time out of each evaluation. None for no time outs.
+        :param max_resident: Number of robots to keep in memory while expanding the population. Evaluated robots
+            beyond this are spilled to robot_store and loaded again when needed. Must be larger than pop_size, as the
+            new robots of a generation and the best robot are never spilled. Spilled robots are aged in the table, so
+            the robots must report their drift (see RobotInterface.get_generation_drift) and must not override
+            dominates (see PopulationTable.can_vectorize). None to keep every robot in memory.
+        :param robot_store: Where spilled robots are kept. See SQLiteRobotStore
+        :param hv_reference: Reference point of the hypervolume in last_metrics; the minimize values followed by the
+            maximize values. None to skip the hypervolume.
+        :param archive: EliteArchive offered every robot evaluated successfully. None to keep no archive.
+        """
+        assert max_resident is None or robot_store is not None, "max_resident needs a robot_store to spill to."
+        assert max_resident is None or max_resident > pop_size, "max_resident must be larger than pop_size."
+        example_robot = robot_factory()
+        assert isinstance(example_robot, RobotInterface), 'robot_factory needs to produce robots which' \
+                                                         'conform to the RobotInterface interface'
+        if max_resident is not None:
+            assert PopulationTable.can_vectorize(example_robot), \
+                "max_resident needs robots which do not override dominates."
+            assert example_robot.get_generation_drift() is not None, \
+                "max_resident needs robots which report their drift with get_generation_drift."
 
         self.messages_file = messages_file
 
         self.pop_size = pop_size
         self.robot_factory = robot_factory
+        self.remote_reproduction = remote_reproduction
 
         self.students = [None] * self.pop_size
         self.robot_id = 0
+        self.rng = RNGStreams(seed)
+        self.deadlines = deadlines
+        self.eval_events = {"timeouts": 0, "worst": 0, "reevaluate": 0, "stopped_early": 0}
+        self.max_resident = max_resident
+        self.robot_store = robot_store
+        self.memory_stats = {}
+        self.eval_stats = {}
+        self._best_id = None
+        self._unranked_ids = set()
+        self.hv_reference = hv_reference
+        self.last_metrics = None
+        self.archive = archive
         if ParallelPyMissing:
-            self.pool = Pool()
+            self.pool = PoolEvaluator(processes=eval_slots)
+            eval_slots = self.pool.processes
+        self.scheduler = MakespanScheduler(num_slots=eval_slots)
         self.initialize()
 
     def __str__(self):
@@ -49,8 +124,15 @@ class AFPOMoo(object):
 
     def initialize(self):
         for i in range(self.pop_size):
-            self.students[i] = self.robot_factory()
-            self.students[i].set_id(self.get_robot_id())
+            self.students[i] = self.new_immigrant()
+        self.table = PopulationTable()
+        self.table.append(self.students, [-1] * self.pop_size, [0] * self.pop_size)
+
+    def new_immigrant(self):
+        with seeded(self.rng.immigrant_seed_sequence()):
+            robot = self.robot_factory()
+        robot.set_id(self.get_robot_id())
+        return robot
 
     def get_robot_id(self):
         self.robot_id += 1
@@ -67,65 +149,342 @@ class AFPOMoo(object):
 
     def _iterate_generation(self):
         # update generation dependent values of the students.
-        for s in self.students:
-            s.iterate_generation()
+        self.table.ages += 1
 
-    def _evaluate_all(self, batch_eval=None):
-        # get the robots to evaluate, store how many simulations each robot needs.
-        students_to_evaluate = [s for s in self.students if s.needs_evaluation()]
+        # robots which report their drift, which includes every spilled robot, are aged in the table. They catch up
+        # on the missed iterate_generation calls when they are next used. See _student
+        aged_in_table = self.table.aged_in_table
+        if aged_in_table.any():
+            self.table.owed_generations[aged_in_table] += 1
+            self.table.minimize[aged_in_table] += self.table.minimize_drift[aged_in_table]
+            self.table.maximize[aged_in_table] += self.table.maximize_drift[aged_in_table]
+
+        rows = np.flatnonzero(~aged_in_table)
+        for i in rows:
+            self.students[i].iterate_generation()
+        self.table.refresh([self.students[i] for i in rows], rows=rows)
+
+    def _student(self, i):
+        """
+        :param i: Index of the student.
+        :return: The student, loaded from the robot store if it was spilled, with its ageing caught up.
+        """
+        if self.students[i] is None:
+            self.students[i] = self.robot_store.get(self.table.ids[i])
+            self.table.resident[i] = True
+        robot = self.students[i]
+        if self.table.owed_generations[i] > 0:
+            for _ in range(self.table.owed_generations[i]):
+                robot.iterate_generation()
+            self.table.owed_generations[i] = 0
+            self.table.refresh([robot], rows=[i])
+        return robot
+
+    def _spill(self, numb_incoming):
+        """
+        Moves evaluated students to the robot store until at most max_resident robots will be in memory once
+        numb_incoming new robots have been added. The oldest are spilled first; the best robot is never spilled.
+        Only robots aged in the table are spilled, as they need not be touched until they are loaded again.
+        """
+        if self.max_resident is None:
+            return
+        excess = int(np.count_nonzero(self.table.resident)) + numb_incoming - self.max_resident
+        if excess <= 0:
+            return
+        candidates = np.flatnonzero(self.table.resident & self.table.aged_in_table & ~self.table.needs_eval &
+                                    (self.table.timeouts == 0) & (self.table.ids != self._best_id))
+        candidates = candidates[np.argsort(-self.table.ages[candidates], kind="stable")][:excess]
+        # nothing can be spilled before the first evaluation.
+        if len(candidates) < excess and not self.table.needs_eval.all():
+            print_all("WARNING: only %d robots can be spilled; %d robots over max_resident will be in memory."
+                      % (len(candidates), excess - len(candidates)))
+        for i in candidates:
+            self.robot_store.put(self.table.ids[i], pickle.dumps(self.students[i]))
+            self.students[i] = None
+            self.table.resident[i] = False
+
+    def _record_memory(self):
+        self.memory_stats["peak_resident"] = max(self.memory_stats.get("peak_resident", 0),
+                                                 sum(s is not None for s in self.students))
+        rss = current_rss()
+        if rss is not None:
+            self.memory_stats["peak_rss"] = max(self.memory_stats.get("peak_rss", 0), rss)
 
-        if batch_eval is None:
-            batch_complete_work(students_to_evaluate)
+    def evaluate_batch(self, work):
+        """
+        The default evaluation backend. parallelpy's batch_complete_work, or a local PoolEvaluator if it is missing.
+        :param work: list of TimedWork to complete.
+        :return: None
+        """
+        if ParallelPyMissing:
+            self.pool(work)
+        else:
+            batch_complete_work(work)
+
+    def _submit(self, work, predicted):
+        """
+        Generator step which yields work to be evaluated, longest predicted first.
+        :return: (eval_times, timed_out, predicted makespan). eval_times and timed_out are in the order of work.
+        """
+        if len(work) == 0:
+            return np.zeros(0), np.zeros(0, dtype=bool), self.scheduler.estimate_makespan([], [])
+        cpus = np.array([w.cpus_requested() for w in work], dtype=np.int64)
+        order = self.scheduler.order(predicted, cpus)
+        makespan = self.scheduler.estimate_makespan(predicted[order], cpus[order])
+
+        if self.deadlines is None:
+            timed_work = [TimedWork(work[k], predicted=predicted[k]) for k in order]
         else:
-            batch_eval(students_to_evaluate)
+            recent_times = self.scheduler.recent_times
+            timed_work = [TimedWork(work[k], predicted=predicted[k],
+                                    timeout=self.deadlines.deadline(recent_times, predicted[k]),
+                                    straggler_after=self.deadlines.straggler_after(predicted[k])) for k in order]
+
+        yield timed_work
+
+        eval_times = np.full(len(work), np.nan)
+        eval_times[order] = [w.eval_time for w in timed_work]
+        timed_out = np.zeros(len(work), dtype=bool)
+        timed_out[order] = [w.timed_out for w in timed_work]
+        return eval_times, timed_out, makespan
+
+    def _evaluate_all(self, reproduction_work=()):
+        # get the robots to evaluate, store how many simulations each robot needs.
+        rows = np.flatnonzero(self.table.needs_eval)
+        work = [self._student(i) for i in rows] + list(reproduction_work)
+
+        # predict the cost of each robot from its own or its parent's history.
+        known_times = dict(zip(self.table.ids, self.table.eval_times))
+        parent_ids = list(self.table.parent_ids[rows]) + [w.parent.get_id() for w in reproduction_work]
+        own_times = np.concatenate((self.table.eval_times[rows], np.full(len(reproduction_work), np.nan)))
+        predicted = self.scheduler.predict(own_times, [known_times.get(p, np.nan) for p in parent_ids])
+
+        # robots using the staged evaluation protocol only run their first stage in the first batch.
+        numb_stages = np.array([w.parent.get_num_eval_stages() if isinstance(w, ReproductionWork)
+                                else w.get_num_eval_stages() for w in work], dtype=np.int64)
+        for w in work[:len(rows)]:
+            if w.get_num_eval_stages() > 1:
+                w.set_eval_stage(0)
+        eval_times, timed_out, makespan = yield from self._submit(work, predicted / numb_stages)
+
+        # a child which timed out never came back from the worker; it is rebuilt here from its seed.
+        for w, w_timed_out in zip(reproduction_work, timed_out[len(rows):]):
+            if w_timed_out:
+                w.child = make_child(w.parent, w.child_id, w.seed_sequence)
+        robots = work[:len(rows)] + [w.child for w in reproduction_work]
+
+        stopped = np.zeros(len(robots), dtype=bool)
+        if np.any(numb_stages > 1):
+            stages_makespan = yield from self._evaluate_stages(robots, rows, numb_stages, predicted, eval_times,
+                                                               timed_out, stopped)
+            if makespan is not None:
+                makespan += stages_makespan
+        self.scheduler.last_predicted_makespan = makespan
+
+        # the time of an evaluation which was cut short is only a lower bound; keep it out of the recent times.
+        self.scheduler.record(eval_times[~timed_out])
+        self.table.eval_times[rows] = eval_times[:len(rows)]
+        self.table.timeouts[rows] = np.where(timed_out[:len(rows)], self.table.timeouts[rows] + 1, 0)
+        self.table.stopped_early[rows] = stopped[:len(rows)]
+        if timed_out.any():
+            self._log_timeouts(int(np.count_nonzero(timed_out)))
+
+        # only the evaluated robots changed; the rest of the population was aged in the table.
+        self.table.refresh(robots[:len(rows)], rows=rows)
+        return eval_times[len(rows):], timed_out[len(rows):], stopped[len(rows):]
+
+    def _evaluate_stages(self, robots, rows, numb_stages, predicted, eval_times, timed_out, stopped):
+        """
+        Runs the remaining stages of the robots using the staged evaluation protocol (see
+        RobotInterface.get_num_eval_stages). Before every stage, robots whose objective bounds are dominated by an
+        already evaluated robot are stopped early. eval_times, timed_out and stopped are updated in place.
+        :return: The predicted makespan of the extra stages. None if the number of eval slots is unknown.
+        """
+        # the robots which were not evaluated this generation are already complete.
+        done_rows = np.setdiff1d(np.arange(len(self.students)), rows)
+
+        numb_stopped = 0
+        makespan = 0.0
+        stage = 1
+        staged = [k for k in range(len(robots)) if numb_stages[k] > 1 and not timed_out[k]]
+        while True:
+            staged = [k for k in staged if stage < numb_stages[k] and not timed_out[k]]
+            if len(staged) == 0:
+                break
+
+            if self.table.vectorized:
+                complete = [k for k in range(len(robots)) if not robots[k].needs_evaluation() and not timed_out[k]]
+                evaluated_min = np.vstack([self.table.minimize[done_rows]] +
+                                          [[robots[k].get_minimize_vals()] for k in complete])
+                evaluated_max = np.vstack([self.table.maximize[done_rows]] +
+                                          [[robots[k].get_maximize_vals()] for k in complete])
+                keep = []
+                for k in staged:
+                    if self._bound_dominated(robots[k], evaluated_min, evaluated_max):
+                        robots[k].stop_evaluation()
+                        stopped[k] = True
+                        numb_stopped += 1
+                    else:
+                        keep.append(k)
+                staged = keep
+
+            for k in staged:
+                robots[k].set_eval_stage(stage)
+            stage_times, stage_timed_out, stage_makespan = yield from self._submit(
+                [robots[k] for k in staged], predicted[staged] / numb_stages[staged])
+            eval_times[staged] += stage_times
+            timed_out[staged] = stage_timed_out
+            if makespan is not None:
+                makespan = None if stage_makespan is None else makespan + stage_makespan
+            stage += 1
+
+        if numb_stopped > 0:
+            self.eval_events["stopped_early"] += numb_stopped
+            print_all("Stopped %d dominated evaluations early (%d in total)."
+                      % (numb_stopped, self.eval_events["stopped_early"]))
+        return makespan
+
+    @staticmethod
+    def _bound_dominated(robot, evaluated_min, evaluated_max):
+        """
+        :return: True if some evaluated robot dominates the best objective values robot can still reach. False if
+            the robot gives no bound.
+        """
+        bounds = robot.get_objective_bounds()
+        if bounds is None:
+            return False
+        bound_min = np.asarray(bounds[0], dtype=np.float64)
+        bound_max = np.asarray(bounds[1], dtype=np.float64)
+        not_worse = ~(np.any(evaluated_min > bound_min, axis=1) | np.any(evaluated_max < bound_max, axis=1))
+        better = np.any(evaluated_min < bound_min, axis=1) | np.any(evaluated_max > bound_max, axis=1)
+        return bool(np.any(not_worse & better))
+
+    def _log_timeouts(self, numb_timed_out):
+        self.eval_events["timeouts"] += numb_timed_out
+        print_all("WARNING: %d evaluations timed out (%d in total). Fallback: %s"
+                  % (numb_timed_out, self.eval_events["timeouts"], self.deadlines.fallback))
+
     def generation(self, batch_eval=None):
+        """
+        Runs one generation.
+        :param batch_eval: Function which completes a list of Work. Defaults to evaluate_batch. It is given TimedWork
+            wrappers, which have to be completed as they are (compute_work on the worker, open_letter with the letter
+            it wrote) so that evaluation times and time outs are recorded. eval_slots should describe this backend.
+        :return: (number of dominating individuals, FrontRobots of the dominating individuals)
+        """
+        return complete_steps(self.generation_steps(), batch_eval if batch_eval is not None else self.evaluate_batch)
+
+    def generation_steps(self):
+        """
+        Generator version of generation. Yields every list of Work which has to be completed before it can continue,
+        so the work of several populations can be evaluated together. See complete_steps.
+        :return: (number of dominating individuals, FrontRobots of the dominating individuals)
+        """
+        self.memory_stats = {}
+        if self.robot_store is not None:
+            self.robot_store.next_generation()
+        self._spill(numb_incoming=2 * self.pop_size - len(self.students))
+
         # update the generation dependent behavioral_sem_error of the bots.
         self._iterate_generation()
 
         # add a new Student even if the population already is full.
-        new_student = self.robot_factory()
-        new_student.set_id(self.get_robot_id())
-        self.students.append(new_student)
+        new_students = [self.new_immigrant()]
+        parent_ids = [-1]
+        ages = [0]
+
+        # expand the population. Robots whose last evaluation timed out have no valid objectives, so they are not
+        # chosen as parents unless every robot timed out.
+        parents = np.flatnonzero(self.table.timeouts[:self.pop_size] == 0)
+        if len(parents) == 0:
+            parents = np.arange(self.pop_size)
+        reproduction_work = []
+        loaded_parents = {}
+        while len(self.students) + len(new_students) + len(reproduction_work) < self.pop_size * 2:
+            parent_index = int(parents[self.rng.selection.integers(len(parents))])
+            child_id = self.get_robot_id()
+            seed_sequence = self.rng.offspring_seed_sequence(child_id)
+
+            # spilled parents are only read, so they stay in the robot store. A copy is loaded once per generation.
+            parent = self._student(parent_index) if self.table.resident[parent_index] else None
+            if parent is None:
+                parent = loaded_parents.get(parent_index)
+                if parent is None:
+                    parent = self._load_copy(parent_index)
+                    loaded_parents[parent_index] = parent
 
-        # expand the population.
-        while len(self.students) < self.pop_size * 2:
-            parent_index = random.randrange(0, self.pop_size)
-            new_student = copy.deepcopy(self.students[parent_index])
-            new_student.mutate()
-            new_student.set_id(self.get_robot_id())
-            self.students.append(new_student)
+            if self.remote_reproduction:
+                # the workers clone and mutate the parent; only the id and the seed are decided here.
+                reproduction_work.append(ReproductionWork(parent, child_id, seed_sequence))
+            else:
+                new_students.append(make_child(parent, child_id, seed_sequence))
+            parent = None
+            parent_ids.append(self.table.ids[parent_index])
+            ages.append(self.table.ages[parent_index])
 
-        # evaluate all robots
-        self._evaluate_all(batch_eval=batch_eval)
+        numb_local = len(new_students)
+        self.students.extend(new_students)
+        self.table.append(new_students, parent_ids[:numb_local], ages[:numb_local])
+        self._record_memory()
 
-        numb_students = self.pop_size * 2
+        # evaluate all robots. Children made on the workers arrive with their evaluation results.
+        evaluated = self.table.needs_eval.copy()
+        children_eval_times, children_timed_out, children_stopped = yield from self._evaluate_all(
+            reproduction_work=reproduction_work)
+        children = [w.child for w in reproduction_work]
+        self.students.extend(children)
+        self.table.append(children, parent_ids[numb_local:], ages[numb_local:], eval_times=children_eval_times)
+        self.table.timeouts[len(self.students) - len(children):] = children_timed_out
+        self.table.stopped_early[len(self.students) - len(children):] = children_stopped
+        self._record_memory()
 
-        dominating_individuals = 0
-        dom_ind = []
+        evaluated = np.concatenate((evaluated, np.ones(len(children), dtype=bool)))
+        self._unranked_ids.update(self.table.ids[evaluated].tolist())
+        self.eval_stats = {"evaluations": int(np.count_nonzero(evaluated)),
+                           "evaluation_seconds": float(np.nansum(self.table.eval_times[evaluated]))}
+        if self.archive is not None:
+            for i in np.flatnonzero(evaluated & self.evaluated_mask()):
+                self.archive.offer(self.students[i], age=self.table.ages[i])
+
+        numb_students = len(self.students)
+
+        # robots whose evaluation timed out are either the worst, or kept without taking part in selection.
+        worst, protected = None, np.zeros(numb_students, dtype=bool)
+        if self.deadlines is not None:
+            worst, protected = self.deadlines.split_timed_out(self.table.timeouts)
+            self.eval_events["worst"] += int(np.count_nonzero(worst))
+            self.eval_events["reevaluate"] += int(np.count_nonzero(protected))
+
+        # dominates[i, j] is True if student i dominates student j.
+        dominates = self.table.dominance_matrix(self.students, worst=worst, protected=protected)
 
         # calculate real number of dominating individuals.
-        for s in range(len(self.students)):
-            dominated = False
-            for t in range(len(self.students)):
-                if self.students[t].dominates(self.students[s]):
-                    dominated = True
+        dominating_mask = ~np.any(dominates, axis=0) & ~protected
+        dominating_individuals = int(np.count_nonzero(dominating_mask))
+        dom_ind = FrontRobots(self, self.table.ids[dominating_mask].tolist())
+        numb_protected = int(np.count_nonzero(protected))
+
+        alive = np.ones(numb_students, dtype=bool)
+        while numb_students > max(self.pop_size, dominating_individuals + numb_protected):
+            # draw the tournament pairs in batches; the selection stream is consumed the same way on every replay.
+            for i1, i2 in self.rng.selection.integers(len(self.students), size=(len(self.students), 2)):
+                if numb_students <= max(self.pop_size, dominating_individuals + numb_protected):
                     break
-            if not dominated:
-                dom_ind.append(self.students[s])
-                dominating_individuals += 1
-
-        while numb_students > max(self.pop_size, dominating_individuals):
-            i1 = random.randrange(len(self.students))
-            i2 = random.randrange(len(self.students))
-            if i1 == i2:
-                continue
-            if self.students[i1] is None or self.students[i2] is None:
-                continue
-            if self.students[i1].dominates(self.students[i2]):
-                self.students[i2] = None
-                numb_students -= 1
+                if i1 == i2:
+                    continue
+                if not alive[i1] or not alive[i2]:
+                    continue
+                if dominates[i1, i2]:
+                    alive[i2] = False
+                    numb_students -= 1
         # compress the population
-        self.students = [p for p in self.students if p is not None]
+        for i in np.flatnonzero(~alive & ~self.table.resident):
+            self.robot_store.delete(self.table.ids[i])
+        self.students = [self.students[i] for i in np.flatnonzero(alive)]
+        self.table.keep(alive)
+        # the front always survives the tournament, so the metrics are computed on the smaller population.
+        self.last_metrics = front_metrics(self.table, dominating_mask[alive], reference=self.hv_reference,
+                                          evaluated_mask=self.evaluated_mask())
 
         # print warnings if necessary
         if dominating_individuals >= 2 * self.pop_size:
@@ -139,15 +498,86 @@ class AFPOMoo(object):
 
         return dominating_individuals, dom_ind
 
-    def get_all_bots(self):
-        bots = [s for s in self.students if s is not None]
-        return bots
+    def get_eval_times(self):
+        """
+        :return: dict mapping the id of each student to the seconds its last evaluation took.
+        """
+        return dict(zip(self.table.ids.tolist(), self.table.eval_times.tolist()))
+
+    def evaluated_mask(self):
+        """
+        :return: Boolean mask of the students whose last evaluation completed. Robots which timed out still need
+            evaluation, and robots which were stopped early only hold partial objective values.
+        """
+        return (self.table.timeouts == 0) & ~self.table.needs_eval & ~self.table.stopped_early
+
+    def get_all_bots(self, exclude_ids=None, evaluated_only=False):
+        """
+        :param exclude_ids: Optional container of ids to leave out. Spilled robots are only loaded if they are needed.
+        :param evaluated_only: If True, leave out the students which are not evaluated. See evaluated_mask
+        :return: list of the students.
+        """
+        evaluated = self.evaluated_mask()
+        return [self._student(i) for i, robot_id in enumerate(self.table.ids.tolist())
+                if (exclude_ids is None or robot_id not in exclude_ids) and (evaluated[i] or not evaluated_only)]
+
+    def get_student(self, robot_id):
+        """
+        :param robot_id: Id of a robot in the population.
+        :return: The robot. A spilled robot is loaded as a copy and stays in the robot store.
+        """
+        rows = np.flatnonzero(self.table.ids == robot_id)
+        assert len(rows) > 0, "robot %d is not in the population." % robot_id
+        i = int(rows[0])
+        return self._student(i) if self.table.resident[i] else self._load_copy(i)
 
     def get_best(self):
-        best_student = None
-        for s in self.students:
-            if best_student is None:
-                best_student = s
-            if s is not None and s.dominates_final_selection(best_student):
-                best_student = s
+        """
+        Only the robots evaluated since the last call, and robots which are not aged in the table, are compared
+        against the current best robot. The whole population is searched again if the best robot died or was
+        evaluated again. Robots which are not evaluated are only considered if no robot is. See evaluated_mask
+        :return: (fitness, robot) of the best student. The best robot is kept in memory.
+        """
+        evaluated = self.evaluated_mask()
+        if not evaluated.any():
+            evaluated[:] = True
+        best_rows = np.flatnonzero((self.table.ids == self._best_id) & evaluated)
+        if len(best_rows) == 0 or self._best_id in self._unranked_ids:
+            rows = np.flatnonzero(evaluated)
+            best_row, rows = rows[0], rows[1:]
+        else:
+            best_row = best_rows[0]
+            unranked = np.isin(self.table.ids, list(self._unranked_ids))
+            rows = np.flatnonzero((unranked | (self.table.resident & ~self.table.aged_in_table)) & evaluated)
+            rows = rows[rows != best_row]
+        self._unranked_ids = set()
+
+        # robots aged in the table rank the same whatever their age, so they are compared without catching up.
+        best_student = self._peek(best_row)
+        for i in rows:
+            s = self._peek(i)
+            if s.dominates_final_selection(best_student):
+                best_row, best_student = i, s
+        self._best_id = best_student.get_id()
+
+        best_student = self._student(best_row)
         return best_student.get_fitness(), best_student
+
+    def get_all_time_best(self):
+        """
+        :return: (fitness, robot) of the best robot in the archive, which may have left the population.
+        """
+        assert self.archive is not None, "get_all_time_best needs an archive."
+        best_robot = self.archive.best()
+        return best_robot.get_fitness(), best_robot
+
+    def _peek(self, i):
+        # a student without catching up its ageing, or a copy of it if it is spilled.
+        return self.students[i] if self.students[i] is not None else self._load_copy(i)
+
+    def _load_copy(self, i):
+        # a spilled student, brought up to date, which stays in the robot store.
+        robot = self.robot_store.get(self.table.ids[i], remove=False)
+        for _ in range(self.table.owed_generations[i]):
+            robot.iterate_generation()
+        return robot
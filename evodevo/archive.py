@@ -0,0 +1,140 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pickle
+
+import numpy as np
+
+from evodevo.moo_interfaces import MOORobotInterface
+
+
+def objective_descriptor(robot):
+    """
+    Default descriptor of the diversity policy: the objective values of a MOORobotInterface, else the fitness.
+    """
+    if isinstance(robot, MOORobotInterface):
+        return list(robot.get_minimize_vals()) + list(robot.get_maximize_vals())
+    return [robot.get_fitness()]
+
+
+class EliteArchive(object):
+    """
+    Bounded hall of fame of the best robots seen during a run, including robots which have since left the population.
+    Robots are kept as copies taken when they were offered, ordered best first by dominates_final_selection, so the
+    all-time best and the top k are list lookups.
+    Once the archive is full, a robot is evicted by the policy:
+    * "best": the worst robot.
+    * "diversity": the worse robot of the two closest robots in descriptor space. The best robot is never evicted.
+    * "age": the worst robot of the most populated age bucket, so elites of every age are kept.
+    """
+    POLICIES = ("best", "diversity", "age")
+
+    def __init__(self, capacity=20, policy="best", descriptor=objective_descriptor, age_bucket=10):
+        """
+        :param capacity: Maximum number of robots in the archive.
+        :param policy: Eviction policy. One of POLICIES.
+        :param descriptor: Function mapping a robot to a list of numbers. Used by the "diversity" policy. Must be
+            picklable, as the archive is saved in checkpoints.
+        :param age_bucket: Number of generations of age per bucket. Used by the "age" policy.
+        """
+        assert capacity > 0, "capacity must be positive."
+        assert policy in self.POLICIES, "policy must be one of %s" % (self.POLICIES,)
+        self.capacity = capacity
+        self.policy = policy
+        self.descriptor = descriptor
+        self.age_bucket = age_bucket
+
+        # one entry per archived robot, best first.
+        self.robots = []
+        self.ids = []
+        self.ages = []
+        self.features = []
+
+    def __len__(self):
+        return len(self.robots)
+
+    def __contains__(self, robot_id):
+        return robot_id in self.ids
+
+    def best(self):
+        """
+        :return: The best robot ever offered to the archive. None if it is empty.
+        """
+        return self.robots[0] if self.robots else None
+
+    def top(self, k):
+        """
+        :return: list of the k best archived robots, best first.
+        """
+        return self.robots[:k]
+
+    def offer(self, robot, age=0):
+        """
+        Adds a copy of an evaluated robot, replacing any earlier copy of the same robot.
+        :param robot: The robot.
+        :param age: Age of the robot. Used by the "age" policy.
+        :return: True if the robot is in the archive afterwards.
+        """
+        if robot.get_id() in self.ids:
+            self._remove(self.ids.index(robot.get_id()))
+
+        position = self._position(robot)
+        if self.policy == "best" and position >= self.capacity:
+            return False
+
+        # the eviction is decided with the robot itself; only a robot which stays in the archive is copied.
+        self.robots.insert(position, robot)
+        self.ids.insert(position, robot.get_id())
+        self.ages.insert(position, int(age))
+        self.features.insert(position, self.descriptor(robot) if self.policy == "diversity" else None)
+
+        if len(self.robots) > self.capacity and self._remove(self._eviction_index()) == robot.get_id():
+            return False
+        self.robots[self.ids.index(robot.get_id())] = pickle.loads(pickle.dumps(robot))
+        return True
+
+    def _position(self, robot):
+        # binary search for the first archived robot which robot beats. Ties go behind the robots already archived.
+        lo, hi = 0, len(self.robots)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if robot.dominates_final_selection(self.robots[mid]):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def _remove(self, k):
+        robot_id = self.ids[k]
+        for entries in (self.robots, self.ids, self.ages, self.features):
+            del entries[k]
+        return robot_id
+
+    def _eviction_index(self):
+        if self.policy == "best":
+            return len(self.robots) - 1
+
+        if self.policy == "age":
+            buckets = np.asarray(self.ages) // self.age_bucket
+            _, inverse, counts = np.unique(buckets, return_inverse=True, return_counts=True)
+            return int(np.flatnonzero(counts[inverse] == counts.max())[-1])
+
+        # scale every feature to its range in the archive, so no feature dominates the distances.
+        features = np.asarray(self.features, dtype=np.float64)
+        span = features.max(axis=0) - features.min(axis=0)
+        features = features / np.where(span > 0, span, 1.0)
+        distances = np.linalg.norm(features[:, None, :] - features[None, :, :], axis=2)
+        distances[np.tril_indices(len(features))] = np.inf
+        _, j = np.unravel_index(np.argmin(distances), distances.shape)
+        return int(j)
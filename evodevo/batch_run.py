@@ -0,0 +1,102 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import numpy as np
+
+from evodevo.evo_run import EvolutionaryRun
+from evodevo.utils import print_utils
+
+
+class BatchEvolutionaryRun(object):
+    """
+    Runs several EvolutionaryRuns (e.g. different seeds or experiment variants) from one master.
+    Every time the runs need work evaluated, the work of all of them is submitted as one batch, so small populations
+    still keep all of the workers busy. Each run keeps its own directory, database, checkpoints, log file and random
+    number streams, including its global random and np.random state.
+    """
+
+    def __init__(self, runs, batch_eval=None):
+        """
+        :param runs: list of EvolutionaryRun.
+        :param batch_eval: Function which completes a list of TimedWork. Defaults to the backend of the first run.
+        """
+        assert len(runs) > 0, "BatchEvolutionaryRun needs at least one run."
+        for run in runs:
+            assert isinstance(run, EvolutionaryRun)
+        self.runs = runs
+        self.batch_eval = batch_eval if batch_eval is not None else runs[0].afpo_algorithm.evaluate_batch
+
+    def _advance(self, run, steps):
+        # log to the messages file of the run while it runs.
+        if run.messages_file is not None:
+            print_utils.setup(log_file=run.messages_file)
+
+        # each run continues its own global random state, which is also the state saved in its checkpoints. Work
+        # completed in the shared batch can not be told apart, so it should not draw from the global random state on
+        # the master.
+        if run.randRandState is None:
+            random.seed(run.seed)
+            np.random.seed(run.seed)
+        else:
+            random.setstate(run.randRandState)
+            np.random.set_state(run.numpyRandState)
+        try:
+            return next(steps)
+        except StopIteration:
+            return None
+        finally:
+            run.randRandState = random.getstate()
+            run.numpyRandState = np.random.get_state()
+
+    def do_generation(self, printing=False):
+        """
+        Runs one generation of every run which has generations and time left.
+        :return: The number of runs which did a generation.
+        """
+        steps = {run: run.generation_steps(printing=printing) for run in self.runs if run.is_running()}
+        pending = {run: self._advance(run, s) for run, s in steps.items()}
+        pending = {run: work for run, work in pending.items() if work is not None}
+
+        while pending:
+            # longest predicted work first, across all of the runs.
+            work = [w for run_work in pending.values() for w in run_work]
+            work.sort(key=lambda w: -w.predicted if getattr(w, "predicted", None) is not None else 0)
+            self.batch_eval(work)
+
+            pending = {run: self._advance(run, steps[run]) for run in pending}
+            pending = {run: work for run, work in pending.items() if work is not None}
+        return len(steps)
+
+    def run_full(self, printing=False):
+        """
+        Runs every run to completion.
+        """
+        for run in self.runs:
+            run.init()
+
+        while self.do_generation(printing=printing) > 0:
+            pass
+
+        for run in self.runs:
+            if run.columnar_export is not None:
+                run.export_columns()
+            if run.is_time_remaining():
+                run.mark_done()
+            if run.messages_file is not None:
+                print_utils.setup(log_file=run.messages_file)
+            run.cleanup_files()
+        # the runs share one evaluation backend; only shut it down once.
+        self.runs[0].cleanup_mpi()
@@ -0,0 +1,148 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+from collections import deque
+from multiprocessing import Pool
+
+from evodevo.utils.print_utils import print_all
+
+
+def complete_steps(steps, batch_eval):
+    """
+    Drives a generator which yields lists of Work (e.g. AFPOMoo.generation_steps), completing each list with batch_eval.
+    :param steps: The generator.
+    :param batch_eval: Function which completes a list of Work. AFPOMoo yields TimedWork wrappers; batch_eval must
+        complete the wrappers themselves, not the robots inside them.
+    :return: The return value of the generator.
+    """
+    try:
+        work = next(steps)
+        while True:
+            batch_eval(work)
+            work = next(steps)
+    except StopIteration as stop:
+        return stop.value
+
+
+def _complete_work(work):
+    work.compute_work()
+    return work.write_letter()
+
+
+class PoolEvaluator(object):
+    """
+    Completes a batch of Work on a local multiprocessing Pool. Can be passed as batch_eval to AFPOMoo.generation.
+    Unlike parallelpy's batch_complete_work it does not block on a single evaluation:
+    * Work is submitted only when a process is free, so the start time of every evaluation is known.
+    * Once nothing is left to submit, idle processes run speculative duplicates of stragglers (work with a
+      straggler_after attribute that has been running for longer). The first copy to finish wins.
+    * Work with a timeout attribute that has not finished timeout + grace seconds after starting is abandoned and
+      marked timed_out, even if the deadline could not be enforced on the worker.
+    * Abandoned work and losing speculative copies keep their processes busy until they finish. If they take up every
+      process while work is waiting, the pool is terminated and a new one started.
+    parallelpy's batch_complete_work (e.g. over MPI) does none of this; there, time outs rely on TimedWork's SIGALRM on
+    the worker. The counts only describe what this evaluator did.
+    """
+
+    def __init__(self, processes=None, poll_interval=0.01, grace=5.0):
+        """
+        :param processes: Number of worker processes. Defaults to the number of cpus.
+        :param poll_interval: Seconds to sleep between checking on the running work.
+        :param grace: Seconds past the timeout of a piece of work before it is abandoned.
+        """
+        self.processes = processes if processes is not None else (os.cpu_count() or 1)
+        self.poll_interval = poll_interval
+        self.grace = grace
+        self.pool = None
+        self.counts = {"speculative_submissions": 0, "speculative_wins": 0, "abandoned": 0, "restarts": 0}
+        self._orphans = []  # copies which lost the race or were abandoned, but still occupy a process.
+
+    def __getstate__(self):
+        # the pool can not be pickled (e.g. in a checkpoint). A new one is started when needed.
+        state = self.__dict__.copy()
+        state["pool"] = None
+        state["_orphans"] = []
+        return state
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        self._orphans = []
+
+    def __call__(self, work):
+        if self.pool is None:
+            self.pool = Pool(self.processes)
+
+        queue = deque(range(len(work)))
+        running = {}  # index of the work -> list of (start time, AsyncResult), one per submitted copy.
+
+        while queue or running:
+            now = time.time()
+            self._orphans = [r for r in self._orphans if not r.ready()]
+
+            # collect finished work and give up on work which is past its deadline.
+            for i in list(running):
+                attempts = running[i]
+                finished = [n for n, (_, r) in enumerate(attempts) if r.ready()]
+                if finished:
+                    work[i].open_letter(attempts[finished[0]][1].get())
+                    if finished[0] > 0:
+                        self.counts["speculative_wins"] += 1
+                        print_all("Speculative copy of a straggler finished first.")
+                    self._orphans.extend(r for _, r in attempts if not r.ready())
+                    del running[i]
+                    continue
+
+                elapsed = now - attempts[0][0]
+                timeout = getattr(work[i], "timeout", None)
+                if timeout is not None and elapsed > timeout + self.grace:
+                    self.counts["abandoned"] += 1
+                    print_all("WARNING: abandoning an evaluation after %f seconds." % elapsed)
+                    work[i].timed_out = True
+                    work[i].eval_time = elapsed
+                    self._orphans.extend(r for _, r in attempts)
+                    del running[i]
+
+            # work which never finishes would hold its process forever; start over with a new pool.
+            if queue and not running and len(self._orphans) >= self.processes:
+                self.counts["restarts"] += 1
+                print_all("WARNING: %d abandoned evaluations occupy every process. Restarting the pool."
+                          % len(self._orphans))
+                self.close()
+                self.pool = Pool(self.processes)
+
+            # fill the free processes.
+            in_use = sum(len(a) for a in running.values()) + len(self._orphans)
+            while queue and in_use < self.processes:
+                i = queue.popleft()
+                running[i] = [(now, self.pool.apply_async(_complete_work, (work[i],)))]
+                in_use += 1
+
+            # nothing left to submit; use the idle processes to duplicate the slowest stragglers.
+            if not queue and in_use < self.processes:
+                stragglers = [i for i, attempts in running.items()
+                              if len(attempts) == 1 and getattr(work[i], "straggler_after", None) is not None
+                              and now - attempts[0][0] > work[i].straggler_after]
+                stragglers.sort(key=lambda i: running[i][0][0])
+                for i in stragglers[:self.processes - in_use]:
+                    self.counts["speculative_submissions"] += 1
+                    print_all("Submitting a speculative copy of a straggler running for %f seconds."
+                              % (now - running[i][0][0]))
+                    running[i].append((now, self.pool.apply_async(_complete_work, (work[i],))))
+
+            if running:
+                time.sleep(self.poll_interval)
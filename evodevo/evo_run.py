@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import os
 import shutil
 import pickle
@@ -23,13 +24,18 @@ from subprocess import call, check_output
 import numpy as np
 
 from evodevo.afpomoo import AFPOMoo
+from evodevo.evaluation import complete_steps
+from evodevo.export import EXPORT_DIR, ColumnarExporter
+from evodevo.metrics import METRIC_COLUMNS
+from evodevo.monitor import write_status
 from evodevo.moo_interfaces import RobotInterface
+from evodevo.robot_store import SQLiteRobotStore
 from evodevo.utils import print_utils
 from evodevo.utils.print_utils import print_all
 
 
 class EvolutionaryRun(object):
-    def __init__(self, robot_factory, gens, seed, pop_size=75, experiment_name="", source_code_path=".", override_git_hash_change=False, max_time=None, run_dir=None):
+    def __init__(self, robot_factory, gens, seed, pop_size=75, experiment_name="", source_code_path=".", override_git_hash_change=False, max_time=None, run_dir=None, remote_reproduction=False, eval_slots=None, deadlines=None, max_resident_robots=None, hv_reference=None, archive=None, columnar_export=None):
         example_bot = robot_factory()
         assert isinstance(example_bot, RobotInterface)
 
@@ -51,6 +57,8 @@ class EvolutionaryRun(object):
             if os.path.exists("%s/RUNNING" % self.runDir) or os.path.exists("%s/DONE" % self.runDir):
                 print_all("Attempting to load from a checkpoint")
                 if self.load_checkpoint(override_git_hash_change):
+                    # tables added since the checkpoint's database was created.
+                    self.setup_db(example_bot)
                     return
             self.create_directory(delete=True)
 
@@ -63,6 +71,9 @@ class EvolutionaryRun(object):
         self.numpyRandState = None
         self.messages_file = None
         self.experiment_name = experiment_name
+        self.last_status = None
+        assert columnar_export in (None, "generation", "end"), 'columnar_export must be None, "generation" or "end"'
+        self.columnar_export = columnar_export
 
         # set up the Database
         self.con = sqlite3.connect("%s/database.db" % self.runDir)
@@ -70,7 +81,11 @@ class EvolutionaryRun(object):
         self.robot_description_table_enabled = False
         self.setup_db(example_bot)
 
-        self.afpo_algorithm = AFPOMoo(robot_factory, pop_size=pop_size)  # , messages_file=self.messages_file)
+        robot_store = SQLiteRobotStore(self.cur) if max_resident_robots is not None else None
+        self.afpo_algorithm = AFPOMoo(robot_factory, pop_size=pop_size, seed=seed, eval_slots=eval_slots,
+                                      deadlines=deadlines, remote_reproduction=remote_reproduction,
+                                      max_resident=max_resident_robots, robot_store=robot_store,
+                                      hv_reference=hv_reference, archive=archive)  # , messages_file=self.messages_file)
 
     def setup_db(self, example_bot):
         # create the database if needed.
@@ -87,14 +102,30 @@ class EvolutionaryRun(object):
             self.cur.execute("CREATE TABLE IF NOT EXISTS RobotsDesc %s" % robot_desc_columns)
             self.cur.execute("CREATE INDEX IF NOT EXISTS descriptionRobotIndex ON RobotsDesc (id)")
 
+        self.cur.execute("CREATE TABLE IF NOT EXISTS RobotsEval (id INT, generation INT, evalTime FLOAT)")
+        self.cur.execute("CREATE INDEX IF NOT EXISTS evalRobotIndex ON RobotsEval (id)")
+
         self.cur.execute("CREATE TABLE IF NOT EXISTS RobotsRaw (id INT, info BLOB)")
         self.cur.execute("CREATE INDEX IF NOT EXISTS pickledRobotIndex ON RobotsRaw (id)")
 
         self.cur.execute("CREATE TABLE IF NOT EXISTS Generations (generation INT, robot INT)")
         self.cur.execute("CREATE INDEX IF NOT EXISTS genIndex ON Generations (generation)")
 
-        self.cur.execute("CREATE TABLE IF NOT EXISTS Checkpoints (generation INT, checkpoint BLOB)")
+        self.cur.execute("CREATE TABLE IF NOT EXISTS GenerationMetrics (generation INT, %s)"
+                         % ", ".join("%s %s" % column for column in METRIC_COLUMNS))
+        self.cur.execute("CREATE INDEX IF NOT EXISTS metricsGenIndex ON GenerationMetrics (generation)")
+
+        self.cur.execute("CREATE TABLE IF NOT EXISTS Checkpoints (generation INT, checkpoint BLOB, checksum TEXT)")
         self.cur.execute("CREATE INDEX IF NOT EXISTS checkpointIndex ON Checkpoints (generation)")
+        if not self.has_checkpoint_checksums():
+            self.cur.execute("ALTER TABLE Checkpoints ADD COLUMN checksum TEXT")
+
+    def has_checkpoint_checksums(self):
+        """
+        :return: True if the Checkpoints table has a checksum column. Databases of older versions do not.
+        """
+        self.cur.execute("PRAGMA table_info(Checkpoints)")
+        return "checksum" in [column[1] for column in self.cur.fetchall()]
 
     def create_directory(self, delete=False):
 
@@ -157,12 +188,31 @@ class EvolutionaryRun(object):
         cleans up files and cleans up mpi
         """
         if done:
-            call(("rm %s/RUNNING" % self.runDir).split())
-            call(("touch %s/DONE" % self.runDir).split())
+            self.mark_done()
         self.cleanup_files()
         self.cleanup_mpi()
 
+    def mark_done(self):
+        call(("rm %s/RUNNING" % self.runDir).split())
+        call(("touch %s/DONE" % self.runDir).split())
+        if self.last_status is not None:
+            self.last_status["state"] = "done"
+            write_status(self.runDir, self.last_status)
+
+    def is_running(self):
+        """
+        :return: True if there are generations left to do and time to do them.
+        """
+        return self.current_gen < self.num_gens and self.is_time_remaining()
+
     def do_generation(self, printing=False):
+        complete_steps(self.generation_steps(printing=printing), self.afpo_algorithm.evaluate_batch)
+
+    def generation_steps(self, printing=False):
+        """
+        Generator version of do_generation. Yields the lists of Work which have to be completed to continue.
+        See AFPOMoo.generation_steps
+        """
         t0 = time.time()
         if os.path.exists("%s/MORE" % self.runDir):
             call(("rm %s/MORE" % self.runDir).split())
@@ -171,10 +221,19 @@ class EvolutionaryRun(object):
         if printing:
             print_all("generation %d" % (self.current_gen,))
 
-        dom_data = self.afpo_algorithm.generation()
+        dom_data = yield from self.afpo_algorithm.generation_steps()
 
         if printing:
+            if self.afpo_algorithm.scheduler.last_predicted_makespan is not None:
+                print_all("Predicted evaluation makespan: %f" % self.afpo_algorithm.scheduler.last_predicted_makespan)
+            if self.afpo_algorithm.deadlines is not None:
+                print_all("Evaluation events: %s" % self.afpo_algorithm.eval_events)
+                if hasattr(self.afpo_algorithm, "pool"):
+                    print_all("Pool evaluator events: %s" % self.afpo_algorithm.pool.counts)
             print_all("%d individuals are dominating" % (dom_data[0],))
+            print_all("Front metrics: %s" % dict(self.afpo_algorithm.last_metrics))
+            if self.afpo_algorithm.archive is not None:
+                print_all("All-time best: %s" % self.afpo_algorithm.get_all_time_best()[1])
             dom_inds = sorted(dom_data[1], key= lambda x: x.get_fitness(), reverse=False)
             print_all('\n'.join([str(d) for d in dom_inds]))
 
@@ -184,15 +243,32 @@ class EvolutionaryRun(object):
         #     # print_all("age: %f fit: %f" % (best[1], best[0]), self.messages_file)
         #     print_all(best[1])
 
-        self.save_data(best[1], best=True)
+        eval_times = self.afpo_algorithm.get_eval_times()
+        # robots whose evaluation did not complete are saved once it does.
+        evaluated_ids = set(self.afpo_algorithm.table.ids[self.afpo_algorithm.evaluated_mask()].tolist())
+        if best[1].get_id() in evaluated_ids:
+            self.save_data(best[1], best=True, eval_time=eval_times[best[1].get_id()])
 
-        all_bots = self.afpo_algorithm.get_all_bots()
+        # robots which are already saved do not need to be loaded back into memory.
+        all_bots = self.afpo_algorithm.get_all_bots(exclude_ids=self.saved_robots, evaluated_only=True)
         for s in all_bots:
-            self.save_data(s)
+            self.save_data(s, eval_time=eval_times[s.get_id()])
+        # robots which left the population are never saved again, so only the population needs to be remembered.
+        self.saved_robots = dict.fromkeys([robot_id for robot_id in self.afpo_algorithm.table.ids.tolist()
+                                           if robot_id in self.saved_robots], 1)
+        self.save_metrics(self.afpo_algorithm.last_metrics)
         self.create_checkpoint()
         self.con.commit()
+        if self.columnar_export == "generation":
+            self.export_columns()
         t1 = time.time()
         print_all("Generation took: %f" % (t1 - t0))
+        self.update_status(best, t1 - t0)
+        if self.afpo_algorithm.max_resident is not None:
+            memory_stats = self.afpo_algorithm.memory_stats
+            print_all("Peak memory: %.1f MB, %d robots in memory, %.1f MB spilled"
+                      % (memory_stats.get("peak_rss", 0) / 2 ** 20, memory_stats.get("peak_resident", 0),
+                         self.afpo_algorithm.robot_store.stored_bytes / 2 ** 20))
 
     def run_full(self, printing=False):
         """
@@ -200,12 +276,20 @@ class EvolutionaryRun(object):
         """
         self.init()
 
-        while self.current_gen < self.num_gens and self.is_time_remaining():
+        while self.is_running():
             self.do_generation(printing=printing)
+        if self.columnar_export is not None:
+            self.export_columns()
 
         self.cleanup_all(done=self.is_time_remaining())
 
-    def save_data(self, robot, best=False):
+    def export_columns(self):
+        """
+        Appends the robots saved since the last export to the memory mappable column files. See evodevo.export
+        """
+        ColumnarExporter(self.runDir).export(self.cur)
+
+    def save_data(self, robot, best=False, eval_time=None):
         if robot.get_id() not in self.saved_robots:
             # log that this robot has been saved. We don't need to re-save it.
             self.saved_robots[robot.get_id()] = 1
@@ -216,6 +300,7 @@ class EvolutionaryRun(object):
             summaryMask = "(" + ", ".join(["?"]*num_fields) + ")"
             self.cur.execute("INSERT INTO Robots VALUES %s"%summaryMask, robot.get_summary_sql_data())
             self.cur.execute("INSERT INTO RobotsRaw VALUES (?, ?)", (robot.get_id(), pickle.dumps(robot)))
+            self.cur.execute("INSERT INTO RobotsEval VALUES (?, ?, ?)", (robot.get_id(), self.current_gen, eval_time))
 
             if self.robot_description_table_enabled:
                 num_fields = len(robot.get_description_sql_columns().split(","))
@@ -226,6 +311,45 @@ class EvolutionaryRun(object):
         if best:
             self.cur.execute("INSERT INTO Generations VALUES (?, ?)", (self.current_gen, robot.get_id()))
 
+    def update_status(self, best, generation_seconds):
+        """
+        Writes the status snapshot of the run, which evodevo.monitor reads instead of the database.
+        :param best: (fitness, robot) of the best robot of the generation.
+        :param generation_seconds: Seconds the generation took.
+        """
+        afpo = self.afpo_algorithm
+        eval_stats = afpo.eval_stats
+        status = {"run_dir": self.runDir,
+                  "experiment_name": self.experiment_name,
+                  "seed": self.seed,
+                  "state": "running",
+                  "generation": self.current_gen,
+                  "num_gens": self.num_gens,
+                  "updated": time.time(),
+                  "elapsed_seconds": time.time() - self.start_time,
+                  "generation_seconds": generation_seconds,
+                  "predicted_makespan": afpo.scheduler.last_predicted_makespan,
+                  "evaluations": eval_stats.get("evaluations", 0),
+                  "evaluation_seconds": eval_stats.get("evaluation_seconds", 0.0),
+                  "evaluations_per_second": eval_stats.get("evaluations", 0) / max(generation_seconds, 1e-9),
+                  "eval_events": dict(afpo.eval_events),
+                  "metrics": dict(afpo.last_metrics) if afpo.last_metrics is not None else None,
+                  "best": {"id": int(best[1].get_id()), "fitness": float(best[0])}}
+        if afpo.archive is not None:
+            all_time_best = afpo.get_all_time_best()
+            status["all_time_best"] = {"id": int(all_time_best[1].get_id()), "fitness": float(all_time_best[0])}
+        if afpo.max_resident is not None:
+            status["memory"] = dict(afpo.memory_stats)
+        write_status(self.runDir, status)
+        self.last_status = status
+
+    def save_metrics(self, metrics):
+        """
+        Stores the front metrics of the current generation. See evodevo.metrics.front_metrics
+        """
+        values = [self.current_gen] + [metrics[name] for name, _ in METRIC_COLUMNS]
+        self.cur.execute("INSERT INTO GenerationMetrics VALUES (%s)" % ", ".join(["?"] * len(values)), values)
+
     def create_checkpoint(self):
         self.randRandState = random.getstate()
         self.numpyRandState = np.random.get_state()
@@ -236,7 +360,9 @@ class EvolutionaryRun(object):
         tmp_con = self.con
         self.con = None
 
-        tmp_cur.execute("INSERT INTO Checkpoints VALUES (?, ?)", (self.current_gen, pickle.dumps(self)))
+        checkpoint = pickle.dumps(self)
+        tmp_cur.execute("INSERT INTO Checkpoints VALUES (?, ?, ?)",
+                        (self.current_gen, checkpoint, hashlib.sha256(checkpoint).hexdigest()))
         self.con = tmp_con
         self.cur = tmp_cur
         self.messages_file = tmp
@@ -267,13 +393,11 @@ class EvolutionaryRun(object):
                 self.con = sqlite3.connect("%s/database.db" % self.runDir)
                 self.cur = self.con.cursor()
 
-                # get the newest checkpoint and attempt to load it in.
-                self.cur.execute("SELECT (checkpoint) FROM Checkpoints ORDER BY Generation DESC limit 1")
-                res = self.cur.fetchone()
-                if res is None:
-                    print_all("No checkpoints were found.\nStarting from scratch.")
+                # get the newest valid checkpoint and attempt to load it in.
+                candidate_checkpoint = self.newest_valid_checkpoint()
+                if candidate_checkpoint is None:
+                    print_all("No valid checkpoints were found.\nStarting from scratch.")
                     return False
-                candidate_checkpoint = pickle.loads(res[0])
                 self.setstate(candidate_checkpoint)
 
 
@@ -292,6 +416,8 @@ class EvolutionaryRun(object):
                             return False
                         else:
                             break
+                self.remove_rows_after_checkpoint()
+                self.con.commit()
                 print_all("Successfully loaded checkpoint at gen %d" % self.current_gen)
                 if gens_to_add > 0:
                     print_all("Adding %d additional generations" % gens_to_add)
@@ -308,6 +434,81 @@ class EvolutionaryRun(object):
             print_all("Failed to load from checkpoint. Run directory missing.\nStarting from scratch.")
             return False
 
+    def newest_valid_checkpoint(self):
+        """
+        Finds the newest checkpoint which matches its checksum and can be unpickled. Checkpoints are read one at a
+        time, newest first, so a corrupt checkpoint falls back to the previous one.
+        :return: The EvolutionaryRun stored in the checkpoint. None if no checkpoint is valid.
+        """
+        checksum_column = "checksum" if self.has_checkpoint_checksums() else "NULL"
+        self.cur.execute("SELECT rowid, generation, %s FROM Checkpoints ORDER BY generation DESC, rowid DESC"
+                         % checksum_column)
+        for rowid, generation, checksum in self.cur.fetchall():
+            self.cur.execute("SELECT checkpoint FROM Checkpoints WHERE rowid = ?", (rowid,))
+            data = self.cur.fetchone()[0]
+            # checkpoints written by older versions have no checksum.
+            if checksum is not None and hashlib.sha256(data).hexdigest() != checksum:
+                print_all("WARNING: the checkpoint at gen %d is corrupt. Trying the previous one." % generation)
+                continue
+            try:
+                candidate_checkpoint = pickle.loads(data)
+            except Exception as e:
+                print_all("WARNING: unable to unpickle the checkpoint at gen %d. Trying the previous one." % generation)
+                print_all("Error was: %s" % e)
+                continue
+
+            # the robot store only keeps the robots the last few checkpoints need.
+            spilled_ids = self.missing_spilled_robots(candidate_checkpoint)
+            if len(spilled_ids) > 0:
+                print_all("WARNING: %d robots spilled at gen %d are missing from the database. Trying the previous "
+                          "checkpoint." % (len(spilled_ids), generation))
+                continue
+            return candidate_checkpoint
+        return None
+
+    def missing_spilled_robots(self, candidate_checkpoint):
+        """
+        :return: Set of the ids of the robots the checkpoint expects in the robot store which are not there.
+        """
+        afpo = candidate_checkpoint.afpo_algorithm
+        if getattr(afpo, "robot_store", None) is None:
+            return set()
+        spilled_ids = set(afpo.table.ids[~afpo.table.resident].tolist())
+        if len(spilled_ids) == 0:
+            return set()
+        afpo.robot_store.attach(self.cur)
+        return spilled_ids - afpo.robot_store.live_ids()
+
+    def remove_rows_after_checkpoint(self):
+        """
+        Deletes the rows written after the loaded checkpoint, e.g. by generations after a corrupt checkpoint, so the
+        resumed run does not store them twice.
+        """
+        last_robot_id = self.afpo_algorithm.robot_id
+        robot_tables = ["Robots", "RobotsRaw", "RobotsEval"]
+        if self.robot_description_table_enabled:
+            robot_tables.append("RobotsDesc")
+        generation_tables = ["Generations", "GenerationMetrics", "Checkpoints"]
+
+        self.cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        existing_tables = set(row[0] for row in self.cur.fetchall())
+
+        numb_removed = 0
+        for table in robot_tables:
+            if table in existing_tables:
+                self.cur.execute("DELETE FROM %s WHERE id > ?" % table, (last_robot_id,))
+                numb_removed += self.cur.rowcount
+        for table in generation_tables:
+            if table in existing_tables:
+                self.cur.execute("DELETE FROM %s WHERE generation > ?" % table, (self.current_gen,))
+                numb_removed += self.cur.rowcount
+        if self.afpo_algorithm.robot_store is not None:
+            numb_removed += self.afpo_algorithm.robot_store.rollback()
+        if numb_removed > 0:
+            print_all("Removed %d rows written after the checkpoint at gen %d" % (numb_removed, self.current_gen))
+        if os.path.isdir(os.path.join(self.runDir, EXPORT_DIR)):
+            ColumnarExporter(self.runDir).truncate(last_robot_id, self.current_gen)
+
     def setstate(self, other):
         self.saved_robots = other.saved_robots
         self.data_column_cnt = other.data_column_cnt
@@ -318,7 +519,11 @@ class EvolutionaryRun(object):
         self.numpyRandState = other.numpyRandState
         self.messages_file = None
         self.experiment_name = other.experiment_name
+        self.last_status = getattr(other, "last_status", None)
+        self.columnar_export = getattr(other, "columnar_export", None)
         self.afpo_algorithm = other.afpo_algorithm
+        if self.afpo_algorithm.robot_store is not None:
+            self.afpo_algorithm.robot_store.attach(self.cur)
         self.robot_description_table_enabled = other.robot_description_table_enabled
 
         random.setstate(self.randRandState)
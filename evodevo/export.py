@@ -0,0 +1,355 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Columnar export of the robot tables of a run to .npy files which can be memory mapped with np.load(mmap_mode="r").
+Every column of Robots, RobotsDesc and RobotsEval is written to <run_dir>/columns/<table>.<column>.npy, one entry per
+robot, ordered by id. TEXT columns are stored as utf-8 bytes in <table>.<column>.data.npy, with entry i spanning
+data[offsets[i]:offsets[i + 1]] of <table>.<column>.offsets.npy. BLOB columns are not exported.
+generations.npy holds one (generation, start, stop) row per generation which saved robots; the robots saved in that
+generation are rows start to stop - 1 of every table.
+
+Usage:
+    python -m evodevo.export run_dir
+"""
+
+import argparse
+import io
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+from evodevo.utils.file_utils import write_json_atomically
+from evodevo.utils.print_utils import print_all
+
+EXPORT_DIR = "columns"
+MANIFEST_FILE = "manifest.json"
+GENERATIONS_FILE = "generations.npy"
+EXPORTED_TABLES = ("Robots", "RobotsDesc", "RobotsEval")
+INT_NULL = np.iinfo(np.int64).min  # stored in place of NULL in INT columns.
+
+
+def column_kind(declared_type):
+    """
+    :param declared_type: The type of a column in its CREATE TABLE statement.
+    :return: "int", "float" or "text", following sqlite's type affinity rules. None for BLOB columns.
+    """
+    declared_type = (declared_type or "").upper()
+    if "INT" in declared_type:
+        return "int"
+    if "CHAR" in declared_type or "CLOB" in declared_type or "TEXT" in declared_type:
+        return "text"
+    if "BLOB" in declared_type or declared_type == "":
+        return None
+    return "float"
+
+
+def _read_npy_header(f):
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+    return version, shape, dtype, f.tell()
+
+
+def _npy_header(version, shape, dtype):
+    header = io.BytesIO()
+    d = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": shape}
+    if version == (1, 0):
+        np.lib.format.write_array_header_1_0(header, d)
+    else:
+        np.lib.format.write_array_header_2_0(header, d)
+    return header.getvalue()
+
+
+def resize_npy(path, rows, values=None):
+    """
+    Truncates the .npy file at path to its first rows rows and appends values along the first axis.
+    The data is written first and the header last, in place. numpy leaves room in the header for the shape to grow;
+    if the new shape still does not fit, the whole file is rewritten.
+    :param path: Path of the file. Created from values if it does not exist.
+    :param rows: Number of rows to keep.
+    :param values: Array of the rows to append. None to only truncate.
+    :return: Number of rows in the file afterwards.
+    """
+    if not os.path.exists(path):
+        if values is None:
+            return 0
+        np.save(path, values)
+        return len(values)
+
+    with open(path, "r+b") as f:
+        version, shape, dtype, header_len = _read_npy_header(f)
+        if values is None:
+            values = np.zeros((0,) + shape[1:], dtype=dtype)
+        values = np.ascontiguousarray(values, dtype=dtype)
+        rows = min(rows, shape[0])
+        new_shape = (rows + len(values),) + shape[1:]
+        if len(values) == 0 and new_shape == shape:
+            return rows
+        header = _npy_header(version, new_shape, dtype)
+        if len(header) == header_len:
+            f.truncate(header_len + rows * int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(values.tobytes())
+            f.flush()
+            f.seek(0)
+            f.write(header)
+            return new_shape[0]
+
+    data = np.concatenate((np.load(path)[:rows], values))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def _load(path):
+    # an empty file can not be memory mapped.
+    array = np.load(path, mmap_mode="r")
+    return array if array.size > 0 else np.load(path)
+
+
+class TextColumn(object):
+    """
+    Read-only view of an exported TEXT column. Indexing decodes a single entry.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+
+class ColumnarExporter(object):
+    """
+    Appends the robots saved to a run's database to the .npy files of the export, incrementally.
+    manifest.json records how many rows of each file are complete; it is replaced atomically after each export, so
+    an export which was interrupted is rolled back and redone by the next one.
+    """
+
+    def __init__(self, run_dir, out_dir=None):
+        """
+        :param run_dir: The run directory.
+        :param out_dir: Where the .npy files are written. Defaults to <run_dir>/columns
+        """
+        self.run_dir = run_dir
+        self.out_dir = out_dir if out_dir is not None else os.path.join(run_dir, EXPORT_DIR)
+
+    def _path(self, *name):
+        return os.path.join(self.out_dir, ".".join(name) + ".npy")
+
+    def read_manifest(self):
+        """
+        :return: dict with the id of the last exported robot, the columns and rows of each table, and the number of
+            generations in the index.
+        """
+        try:
+            with open(os.path.join(self.out_dir, MANIFEST_FILE)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {"last_id": 0, "tables": {}, "generations": 0}
+
+    def _write_manifest(self, manifest):
+        write_json_atomically(os.path.join(self.out_dir, MANIFEST_FILE), manifest)
+
+    def _resize_column(self, table, name, kind, rows, values=None):
+        if kind != "text":
+            resize_npy(self._path(table, name), rows, values)
+            return
+
+        offsets_path, data_path = self._path(table, name, "offsets"), self._path(table, name, "data")
+        if not os.path.exists(offsets_path):
+            resize_npy(offsets_path, 0, np.zeros(1, dtype=np.int64))
+        offsets = np.load(offsets_path, mmap_mode="r")
+        end = int(offsets[min(rows, len(offsets) - 1)])
+        del offsets
+
+        encoded = [] if values is None else [(u"" if v is None else str(v)).encode("utf-8") for v in values]
+        new_offsets = end + np.cumsum([len(e) for e in encoded], dtype=np.int64)
+        resize_npy(data_path, end, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        resize_npy(offsets_path, rows + 1, new_offsets)
+
+    def _rollback(self, manifest):
+        # files can be longer than the manifest says if the last export was interrupted.
+        for table, info in manifest["tables"].items():
+            for name, kind in info["columns"]:
+                self._resize_column(table, name, kind, info["rows"])
+        if os.path.exists(os.path.join(self.out_dir, GENERATIONS_FILE)):
+            resize_npy(os.path.join(self.out_dir, GENERATIONS_FILE), manifest["generations"])
+
+    def export(self, cur):
+        """
+        Appends the robots saved since the last export.
+        :param cur: sqlite3 cursor of the run's database.
+        :return: Number of robots exported.
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        manifest = self.read_manifest()
+        self._rollback(manifest)
+
+        cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        existing_tables = set(row[0] for row in cur.fetchall())
+
+        last_id = manifest["last_id"]
+        numb_exported = 0
+        for table in EXPORTED_TABLES:
+            if table not in existing_tables:
+                continue
+            if table not in manifest["tables"]:
+                cur.execute("PRAGMA table_info(%s)" % table)
+                columns = [[row[1], column_kind(row[2])] for row in cur.fetchall()]
+                manifest["tables"][table] = {"rows": 0, "columns": [c for c in columns if c[1] is not None]}
+            info = manifest["tables"][table]
+
+            cur.execute("SELECT %s FROM %s WHERE id > ? ORDER BY id"
+                        % (", ".join(name for name, _ in info["columns"]), table), (last_id,))
+            rows = cur.fetchall()
+            if len(rows) == 0:
+                continue
+            for (name, kind), values in zip(info["columns"], zip(*rows)):
+                if kind == "int":
+                    values = np.array([INT_NULL if v is None else v for v in values], dtype=np.int64)
+                elif kind == "float":
+                    values = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+                self._resize_column(table, name, kind, info["rows"], values)
+            info["rows"] += len(rows)
+            numb_exported = max(numb_exported, len(rows))
+            id_index = [name for name, _ in info["columns"]].index("id")
+            manifest["last_id"] = max(manifest["last_id"], int(rows[-1][id_index]))
+
+            if table == "RobotsEval":
+                self._index_generations(manifest, info, rows)
+
+        self._write_manifest(manifest)
+        return numb_exported
+
+    def _index_generations(self, manifest, info, rows):
+        names = [name for name, _ in info["columns"]]
+        generations = np.array([row[names.index("generation")] for row in rows], dtype=np.int64)
+        if np.any(np.diff(generations) < 0):
+            print_all("WARNING: robot ids are not ordered by generation; the generation index is not updated.")
+            return
+        first_row = info["rows"] - len(rows)
+        gens, starts = np.unique(generations, return_index=True)
+        stops = np.append(starts[1:], len(generations))
+        index = np.column_stack((gens, starts + first_row, stops + first_row)).astype(np.int64)
+
+        path = os.path.join(self.out_dir, GENERATIONS_FILE)
+        numb_generations = manifest["generations"]
+        if numb_generations > 0:
+            previous = np.load(path)[numb_generations - 1]
+            if previous[0] == index[0, 0]:
+                # the generation continues from the last export.
+                index[0, 1] = previous[1]
+                numb_generations -= 1
+        if not os.path.exists(path):
+            np.save(path, np.zeros((0, 3), dtype=np.int64))
+        manifest["generations"] = resize_npy(path, numb_generations, index)
+
+    def truncate(self, last_id, last_generation):
+        """
+        Removes the robots with an id above last_id, e.g. after a run resumed from an older checkpoint.
+        :param last_id: Id of the last robot to keep.
+        :param last_generation: Last generation to keep in the generation index.
+        :return: None
+        """
+        manifest = self.read_manifest()
+        self._rollback(manifest)
+        for table, info in manifest["tables"].items():
+            if info["rows"] == 0:
+                continue
+            ids = np.load(self._path(table, "id"), mmap_mode="r")
+            info["rows"] = int(np.searchsorted(ids[:info["rows"]], last_id, side="right"))
+            del ids
+            for name, kind in info["columns"]:
+                self._resize_column(table, name, kind, info["rows"])
+        manifest["last_id"] = min(manifest["last_id"], last_id)
+
+        path = os.path.join(self.out_dir, GENERATIONS_FILE)
+        if manifest["generations"] > 0:
+            index = np.load(path)[:manifest["generations"]]
+            index = index[index[:, 0] <= last_generation]
+            rows = manifest["tables"].get("RobotsEval", {}).get("rows", 0)
+            index[:, 2] = np.minimum(index[:, 2], rows)
+            index = index[index[:, 1] < index[:, 2]]
+            manifest["generations"] = resize_npy(path, 0, index)
+        self._write_manifest(manifest)
+
+
+def load_table(out_dir, table):
+    """
+    Opens the exported columns of a table without reading them into memory.
+    :param out_dir: The export directory, e.g. <run_dir>/columns
+    :param table: Name of the table.
+    :return: dict mapping each column name to a memory mapped array, or a TextColumn.
+    """
+    manifest = ColumnarExporter(None, out_dir=out_dir).read_manifest()
+    info = manifest["tables"][table]
+    columns = {}
+    for name, kind in info["columns"]:
+        path = os.path.join(out_dir, "%s.%s" % (table, name))
+        if kind == "text":
+            offsets = _load(path + ".offsets.npy")[:info["rows"] + 1]
+            columns[name] = TextColumn(offsets, _load(path + ".data.npy"))
+        else:
+            columns[name] = _load(path + ".npy")[:info["rows"]]
+    return columns
+
+
+def load_generation_index(out_dir):
+    """
+    :param out_dir: The export directory, e.g. <run_dir>/columns
+    :return: n x 3 array of (generation, first row, last row + 1) of the robots saved in each generation.
+    """
+    manifest = ColumnarExporter(None, out_dir=out_dir).read_manifest()
+    path = os.path.join(out_dir, GENERATIONS_FILE)
+    if manifest["generations"] == 0 or not os.path.exists(path):
+        return np.zeros((0, 3), dtype=np.int64)
+    return _load(path)[:manifest["generations"]]
+
+
+def export_run(run_dir, out_dir=None):
+    """
+    Exports the robots of a run which have not been exported yet. The database is opened read-only.
+    :return: Number of robots exported.
+    """
+    con = sqlite3.connect("file:%s?mode=ro" % os.path.abspath(os.path.join(run_dir, "database.db")), uri=True)
+    try:
+        return ColumnarExporter(run_dir, out_dir=out_dir).export(con.cursor())
+    finally:
+        con.close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Exports the robot tables of a run to memory mappable .npy files.")
+    parser.add_argument("run_dir", help="the run directory.")
+    parser.add_argument("--out", default=None, help="export directory. Defaults to <run_dir>/%s" % EXPORT_DIR)
+    args = parser.parse_args(args)
+    print("Exported %d robots." % export_run(args.run_dir, out_dir=args.out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+
+import numpy as np
+
+# (name, sql type) of each per generation metric, in the order they are stored in the GenerationMetrics table.
+METRIC_COLUMNS = (("hypervolume", "FLOAT"),
+                  ("frontSize", "INT"),
+                  ("frontSpread", "FLOAT"),
+                  ("popSize", "INT"),
+                  ("ageMin", "INT"),
+                  ("ageMedian", "FLOAT"),
+                  ("ageMean", "FLOAT"),
+                  ("ageMax", "INT"),
+                  ("fitnessMin", "FLOAT"),
+                  ("fitnessQ25", "FLOAT"),
+                  ("fitnessMedian", "FLOAT"),
+                  ("fitnessQ75", "FLOAT"),
+                  ("fitnessMax", "FLOAT"))
+
+
+def hypervolume_2d(points, reference):
+    """
+    Area dominated by points and bounded by reference, with both objectives minimized.
+    Sorts the points by the first objective and sweeps once, so it takes O(n log n).
+    :param points: n x 2 array.
+    :param reference: The reference point. Points which do not strictly dominate it are ignored.
+    :return: The hypervolume.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    points = points[np.all(points < reference, axis=1)]
+    points = points[np.lexsort((points[:, 1], points[:, 0]))]
+
+    volume = 0.0
+    lowest = reference[1]
+    for x, y in points:
+        if y < lowest:
+            volume += (reference[0] - x) * (lowest - y)
+            lowest = y
+    return volume
+
+
+def hypervolume(points, reference):
+    """
+    Hypervolume of points with every objective minimized. Uses hypervolume_2d for two objectives; more objectives are
+    sliced along the last objective, which is only practical for small fronts.
+    :param points: n x d array.
+    :param reference: The reference point, length d.
+    :return: The hypervolume.
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, len(reference))
+    points = points[np.all(points < reference, axis=1)]
+    if len(points) == 0:
+        return 0.0
+    if len(reference) == 1:
+        return float(reference[0] - points[:, 0].min())
+    if len(reference) == 2:
+        return hypervolume_2d(points, reference)
+
+    points = points[np.argsort(points[:, -1], kind="stable")]
+    volume = 0.0
+    for i in range(len(points)):
+        upper = points[i + 1, -1] if i + 1 < len(points) else reference[-1]
+        if upper > points[i, -1]:
+            volume += hypervolume(points[:i + 1, :-1], reference[:-1]) * (upper - points[i, -1])
+    return volume
+
+
+def front_metrics(table, front_mask, reference=None, evaluated_mask=None):
+    """
+    Summarizes the population of a generation. The spread of the front is the length of the diagonal of the box
+    bounding its objective values.
+    :param table: The PopulationTable of the population.
+    :param front_mask: Boolean mask of the non-dominated students.
+    :param reference: Hypervolume reference point; the minimized objectives followed by the maximized ones, in their
+        own units. If None, or the table is not vectorized, the hypervolume is not computed.
+    :param evaluated_mask: Optional boolean mask of the students with a valid fitness. Defaults to all of them.
+    :return: OrderedDict with the keys of METRIC_COLUMNS.
+    """
+    if evaluated_mask is None:
+        evaluated_mask = np.ones(len(table), dtype=bool)
+
+    volume, spread = None, None
+    if table.vectorized:
+        # maximized objectives are negated so that everything is minimized.
+        points = np.hstack((table.minimize[front_mask], -table.maximize[front_mask]))
+        if len(points) > 0:
+            spread = float(np.linalg.norm(points.max(axis=0) - points.min(axis=0)))
+        if reference is not None:
+            numb_min = table.minimize.shape[1]
+            reference = np.asarray(reference, dtype=np.float64)
+            volume = hypervolume(points, np.concatenate((reference[:numb_min], -reference[numb_min:])))
+
+    ages = table.ages
+    fitness = table.fitness[evaluated_mask]
+    if len(fitness) > 0:
+        fitness_quantiles = [float(q) for q in np.quantile(fitness, [0, 0.25, 0.5, 0.75, 1])]
+    else:
+        fitness_quantiles = [None] * 5
+
+    values = [volume, int(np.count_nonzero(front_mask)), spread, len(table),
+              int(ages.min()), float(np.median(ages)), float(ages.mean()), int(ages.max())] + fitness_quantiles
+    return OrderedDict(zip([name for name, _ in METRIC_COLUMNS], values))
@@ -0,0 +1,143 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Live monitoring of evolutionary runs without touching their databases.
+Every generation, EvolutionaryRun writes a small json snapshot of its state to STATUS_FILE in its run directory.
+The functions here only ever read those files, so any number of dashboards can poll while the runs are going.
+
+Usage:
+    python -m evodevo.monitor [root_dir]              prints the status of every run below root_dir.
+    python -m evodevo.monitor [root_dir] --port 8000  serves them as json on http://localhost:8000/
+"""
+
+import argparse
+import glob
+import json
+import os
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from evodevo.utils.file_utils import write_json_atomically
+
+STATUS_FILE = "status.json"
+
+
+def write_status(run_dir, status):
+    """
+    Atomically replaces the status snapshot of a run. Readers see either the old or the new snapshot, never part of
+    one.
+    :param run_dir: The run directory.
+    :param status: json serializable dict.
+    :return: None
+    """
+    write_json_atomically(os.path.join(run_dir, STATUS_FILE), status)
+
+
+def read_status(run_dir):
+    """
+    :param run_dir: The run directory.
+    :return: The status snapshot of the run. None if it has not written one yet.
+    """
+    try:
+        with open(os.path.join(run_dir, STATUS_FILE)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def find_runs(root_dir="."):
+    """
+    :param root_dir: Directory containing run directories. May be a run directory itself.
+    :return: Sorted list of the run directories at most one level below root_dir which have a status snapshot.
+    """
+    paths = glob.glob(os.path.join(root_dir, STATUS_FILE)) + glob.glob(os.path.join(root_dir, "*", STATUS_FILE))
+    return sorted(os.path.dirname(p) for p in paths)
+
+
+def read_all(root_dir="."):
+    """
+    :return: dict mapping each run directory below root_dir to its status snapshot.
+    """
+    statuses = {run_dir: read_status(run_dir) for run_dir in find_runs(root_dir)}
+    return {run_dir: status for run_dir, status in statuses.items() if status is not None}
+
+
+def format_table(statuses):
+    """
+    :param statuses: dict from read_all.
+    :return: One line per run, as a string.
+    """
+    lines = ["%-30s %-8s %12s %12s %10s %14s %10s" % ("run", "state", "generation", "best", "gen time",
+                                                       "evals / sec", "front")]
+    for run_dir, status in sorted(statuses.items()):
+        metrics = status.get("metrics") or {}
+        lines.append("%-30s %-8s %5d / %-5d %12.5g %10.2f %14.2f %10s"
+                     % (run_dir, status["state"], status["generation"], status["num_gens"],
+                        status["best"]["fitness"], status["generation_seconds"], status["evaluations_per_second"],
+                        metrics.get("frontSize", "")))
+    return "\n".join(lines)
+
+
+def serve(root_dir=".", port=8000, host="127.0.0.1"):
+    """
+    Serves the status snapshots as json over http until interrupted.
+    GET / returns every run below root_dir. GET /<run directory> returns a single run.
+    """
+
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.strip("/")
+            statuses = read_all(root_dir)
+            if path == "":
+                body = statuses
+            else:
+                # only the runs found below root_dir can be read.
+                body = statuses.get(os.path.join(root_dir, path))
+            if body is None:
+                self.send_error(404, "No status snapshot for %s" % path)
+                return
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer((host, port), StatusHandler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Shows the status snapshots of evolutionary runs.")
+    parser.add_argument("root_dir", nargs="?", default=".", help="directory containing the run directories.")
+    parser.add_argument("--port", type=int, default=None, help="serve the snapshots as json on this port.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to serve on.")
+    args = parser.parse_args(args)
+
+    if args.port is not None:
+        serve(args.root_dir, port=args.port, host=args.host)
+    else:
+        print(format_table(read_all(args.root_dir)))
+
+
+if __name__ == "__main__":
+    main()
@@ -78,6 +78,52 @@ class RobotInterface(Work):
         """
         raise NotImplementedError
 
+    def get_generation_drift(self):
+        """
+        Optional. Lets the population age this robot in its table instead of calling iterate_generation on it every
+        generation. Only return a drift if each call to iterate_generation adds a constant amount to the objective
+        values and changes nothing else the population reads (fitness, needs_evaluation, dominates_final_selection).
+        The robot then catches up on the missed iterate_generation calls when it is next used: mutated, evaluated,
+        saved or returned.
+        :return: (minimize_drift, maximize_drift), the change of get_minimize_vals and get_maximize_vals per
+            generation. None if iterate_generation must be called every generation.
+        """
+        return None
+
+    def get_num_eval_stages(self):
+        """
+        Optional staged evaluation protocol. A robot returning n > 1 here is evaluated in n stages, each its own piece
+        of work: compute_work only runs the stage given to set_eval_stage and open_letter records the partial result.
+        needs_evaluation must stay True until the last stage has been opened.
+        Between stages, a robot which can no longer reach the front is stopped with stop_evaluation.
+        :return: The number of stages. 1 if the robot is evaluated in one go.
+        """
+        return 1
+
+    def set_eval_stage(self, stage):
+        """
+        Called before each stage is sent for evaluation. Stages run in order, starting at 0.
+        :param stage: The stage the next compute_work should run.
+        :return: None
+        """
+        pass
+
+    def get_objective_bounds(self):
+        """
+        The best objective values this robot can still reach after the stages run so far.
+        :return: (minimize_vals, maximize_vals), or None if no bound is known. Robots without a bound are never
+            stopped early.
+        """
+        return None
+
+    def stop_evaluation(self):
+        """
+        Called instead of running the remaining stages. Afterwards needs_evaluation must return False and the
+        objective values must be no better than the last bounds.
+        :return: None
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def dominates(self, other): raise NotImplementedError
 
@@ -153,6 +199,12 @@ class AFPORobotInterface(MOORobotInterface):
         elif self.optimize_mode == "fitness":
             return [self.age]
 
+    def get_generation_drift(self):
+        if self.optimize_mode == "error":
+            return [1, 0], []
+        elif self.optimize_mode == "fitness":
+            return [1], [0]
+
     def get_age(self):
         return self.age
 
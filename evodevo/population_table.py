@@ -0,0 +1,173 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+from evodevo.moo_interfaces import MOORobotInterface
+
+
+class PopulationTable(object):
+    """
+    Struct-of-arrays copy of the per-student scalar state of an AFPOMoo population.
+    Row i always describes AFPOMoo.students[i]. The robots remain the source of truth for their objective values;
+    a row is refreshed from its robot when the robot is evaluated or catches up on its ageing. In between, the
+    objective values of robots aged in the table (see RobotInterface.get_generation_drift) and of spilled robots are
+    advanced by their drift, so that selection can run on arrays without touching the robots.
+    """
+
+    # one dimensional columns: name, dtype, value of a new row.
+    COLUMNS = (("ids", np.int64, -1),
+               ("parent_ids", np.int64, -1),
+               ("ages", np.int64, 0),
+               ("seq_nums", np.int64, 0),
+               ("fitness", np.float64, 0.0),
+               ("needs_eval", bool, False),
+               ("eval_times", np.float64, np.nan),  # seconds taken by the last evaluation. NaN if unknown.
+               ("timeouts", np.int64, 0),  # number of consecutive evaluations which timed out.
+               ("resident", bool, True),  # False if the robot has been spilled to the robot store.
+               ("owed_generations", np.int64, 0),  # iterate_generation calls the robot has missed.
+               ("aged_in_table", bool, False),  # True if the robot reported its drift, so it is aged in the table.
+               ("stopped_early", bool, False))  # True if the last evaluation was stopped early; objectives are partial.
+    # columns with one entry per minimize / maximize objective.
+    OBJECTIVE_COLUMNS = (("minimize", "minimize"),
+                         ("maximize", "maximize"),
+                         ("minimize_drift", "minimize"),  # change of a robot's objectives per generation.
+                         ("maximize_drift", "maximize"))
+
+    def __init__(self):
+        for name, dtype, _ in self.COLUMNS:
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        for name, _ in self.OBJECTIVE_COLUMNS:
+            setattr(self, name, np.zeros((0, 0), dtype=np.float64))
+
+        # None until the first robot is seen. True if MOORobotInterface.dominates can be evaluated on the arrays.
+        self.vectorized = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def can_vectorize(robot):
+        """
+        :return: True if selection on robots like robot can run on the table: the robot is a MOORobotInterface which
+            does not override dominates.
+        """
+        return isinstance(robot, MOORobotInterface) and type(robot).dominates is MOORobotInterface.dominates
+
+    def _check_vectorized(self, robot):
+        if self.vectorized is None:
+            self.vectorized = self.can_vectorize(robot)
+
+    def append(self, robots, parent_ids, ages, eval_times=None):
+        """
+        Adds one row per robot to the end of the table.
+        :param robots: The robots to add, in the order they were appended to the population.
+        :param parent_ids: The id of the parent of each robot. -1 for robots created by the robot_factory.
+        :param ages: The age of each robot.
+        :param eval_times: Measured evaluation time of each robot. If None, the times are unknown.
+        :return: None
+        """
+        if len(robots) == 0:
+            return
+        self._check_vectorized(robots[0])
+        first = len(self)
+
+        values = {"ids": [r.get_id() for r in robots], "parent_ids": parent_ids, "ages": ages}
+        if eval_times is not None:
+            values["eval_times"] = eval_times
+        for name, dtype, default in self.COLUMNS:
+            new_rows = np.asarray(values[name], dtype=dtype) if name in values else np.full(len(robots), default,
+                                                                                             dtype=dtype)
+            setattr(self, name, np.concatenate((getattr(self, name), new_rows)))
+
+        if self.vectorized:
+            widths = {"minimize": len(robots[0].get_minimize_vals()), "maximize": len(robots[0].get_maximize_vals())}
+            for name, kind in self.OBJECTIVE_COLUMNS:
+                setattr(self, name, np.concatenate((getattr(self, name).reshape(first, widths[kind]),
+                                                    np.zeros((len(robots), widths[kind])))))
+        self.refresh(robots, rows=np.arange(first, len(self)))
+
+        if self.vectorized:
+            for row, robot in enumerate(robots, start=first):
+                drift = robot.get_generation_drift()
+                if drift is not None:
+                    self.minimize_drift[row], self.maximize_drift[row] = drift
+                    self.aged_in_table[row] = True
+
+    def refresh(self, robots, rows=None):
+        """
+        Re-reads the objective values and evaluation state from the robots.
+        :param robots: The robots to read from. robots[k] is stored in row rows[k].
+        :param rows: The rows to update. If None, robots must be the whole population.
+        :return: None
+        """
+        if rows is None:
+            rows = np.arange(len(self))
+        if len(rows) == 0:
+            return
+        self.fitness[rows] = [r.get_fitness() for r in robots]
+        self.needs_eval[rows] = [r.needs_evaluation() for r in robots]
+        if self.vectorized:
+            self.seq_nums[rows] = [r.get_seq_num() for r in robots]
+            self.minimize[rows] = [r.get_minimize_vals() for r in robots]
+            self.maximize[rows] = [r.get_maximize_vals() for r in robots]
+
+    def keep(self, mask):
+        """
+        Removes every row where mask is False.
+        :param mask: Boolean array with one entry per row.
+        :return: None
+        """
+        for name, _, _ in self.COLUMNS:
+            setattr(self, name, getattr(self, name)[mask])
+        if self.vectorized:
+            for name, _ in self.OBJECTIVE_COLUMNS:
+                setattr(self, name, getattr(self, name)[mask])
+
+    def dominance_matrix(self, robots, worst=None, protected=None):
+        """
+        Computes D where D[i, j] is True if student i dominates student j.
+        Uses the same rules as MOORobotInterface.dominates. If the robots override dominates, falls back to calling it.
+        :param robots: The population. Only used if the table can not be vectorized.
+        :param worst: Optional boolean mask of students which are dominated by every student not in the mask.
+        :param protected: Optional boolean mask of students which neither dominate nor are dominated.
+        :return: n x n boolean numpy array.
+        """
+        n = len(self)
+        if not self.vectorized:
+            dom = np.zeros((n, n), dtype=bool)
+            for i in range(n):
+                for j in range(n):
+                    dom[i, j] = robots[i].dominates(robots[j])
+        else:
+            dom = self._vectorized_dominance()
+
+        if worst is not None and worst.any():
+            dom[worst, :] = False
+            dom[np.ix_(~worst, worst)] = True
+        if protected is not None and protected.any():
+            dom[protected, :] = False
+            dom[:, protected] = False
+        return dom
+
+    def _vectorized_dominance(self):
+        # i must not have any min trait larger or any max trait smaller than j.
+        mins_i, mins_j = self.minimize[:, None, :], self.minimize[None, :, :]
+        maxs_i, maxs_j = self.maximize[:, None, :], self.maximize[None, :, :]
+        not_worse = ~(np.any(mins_i > mins_j, axis=2) | np.any(maxs_i < maxs_j, axis=2))
+        better = np.any(mins_i < mins_j, axis=2) | np.any(maxs_i > maxs_j, axis=2)
+
+        # if all of the fitness values are the same, the older sequence number wins.
+        tie_break = ~better & (self.seq_nums[:, None] < self.seq_nums[None, :])
+        return not_worse & (better | tie_break)
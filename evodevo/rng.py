@@ -0,0 +1,76 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+from contextlib import contextmanager
+
+import numpy as np
+
+# spawn keys of the streams derived from the root SeedSequence.
+SELECTION_STREAM = 0
+IMMIGRANT_STREAM = 1
+OFFSPRING_STREAM = 2
+
+
+class RNGStreams(object):
+    """
+    Independent random number streams for an evolutionary run, all derived from one numpy SeedSequence.
+    * selection: parent selection and tournaments.
+    * immigrants: seeds the robot_factory when creating new random robots.
+    * offspring: one SeedSequence per child, derived from the id of the child, used while mutating.
+    The generators are plain numpy objects, so pickling this class (e.g. in a checkpoint) captures every stream.
+    """
+
+    def __init__(self, seed=None):
+        """
+        :param seed: Seed for the root SeedSequence. If None, fresh entropy is taken from the OS.
+        """
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.selection = np.random.default_rng(self._derive(SELECTION_STREAM))
+        self.immigrants = np.random.default_rng(self._derive(IMMIGRANT_STREAM))
+
+    def _derive(self, *key):
+        return np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=self.seed_sequence.spawn_key + key)
+
+    def offspring_seed_sequence(self, robot_id):
+        """
+        :param robot_id: The id of the child.
+        :return: The SeedSequence to mutate the child with. Only depends on the root seed and robot_id.
+        """
+        return self._derive(OFFSPRING_STREAM, int(robot_id))
+
+    def immigrant_seed_sequence(self):
+        """
+        :return: A SeedSequence for creating the next immigrant. Advances the immigrants stream.
+        """
+        return np.random.SeedSequence(self.immigrants.integers(0, 2 ** 32, size=4, dtype=np.uint32))
+
+
+@contextmanager
+def seeded(seed_sequence):
+    """
+    Seeds random and np.random from seed_sequence for the duration of the with block, then restores their state.
+    Robot code (robot_factory, mutate) uses the global generators, this makes it reproducible wherever it runs.
+    :param seed_sequence: numpy SeedSequence.
+    """
+    rand_state = random.getstate()
+    np_rand_state = np.random.get_state()
+    words = seed_sequence.generate_state(4)
+    random.seed(int.from_bytes(words.tobytes(), "little"))
+    np.random.seed(words)
+    try:
+        yield
+    finally:
+        random.setstate(rand_state)
+        np.random.set_state(np_rand_state)
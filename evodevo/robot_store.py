@@ -0,0 +1,132 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pickle
+
+
+class SQLiteRobotStore(object):
+    """
+    Keeps pickled robots which have been spilled out of memory in the RobotsSpilled table of the run's database.
+    Writes go through the cursor of the run, so they are committed together with the next checkpoint.
+    Every row records the generation the robot was spilled in and the generation it was loaded again or died in, so a
+    run can fall back to one of its last history checkpoints (see rollback). Rows no such checkpoint needs are pruned.
+    The cursor is not pickled; call attach after loading a checkpoint.
+    """
+
+    def __init__(self, cur=None, history=3):
+        """
+        :param cur: sqlite3 cursor of the run's database.
+        :param history: Number of generations the spilled robots are kept for after they were released.
+        """
+        self.cur = None
+        self.stored_bytes = 0
+        self.generation = 0
+        self.history = history
+        if cur is not None:
+            self.attach(cur)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["cur"] = None
+        return state
+
+    def attach(self, cur):
+        """
+        :param cur: sqlite3 cursor of the run's database.
+        :return: None
+        """
+        self.cur = cur
+        if not hasattr(self, "generation"):
+            # stores pickled by older versions.
+            self.generation = 0
+            self.history = 3
+        self.cur.execute("PRAGMA table_info(RobotsSpilled)")
+        if [row[1] for row in self.cur.fetchall()] == ["id", "info"]:
+            # stores written by older versions kept a single row per robot, which was live in their newest checkpoint.
+            self.cur.execute("ALTER TABLE RobotsSpilled RENAME TO RobotsSpilledOld")
+            self._create_table()
+            self.cur.execute("INSERT INTO RobotsSpilled SELECT id, 0, NULL, info FROM RobotsSpilledOld")
+            self.cur.execute("DROP TABLE RobotsSpilledOld")
+        self._create_table()
+
+    def _create_table(self):
+        self.cur.execute("CREATE TABLE IF NOT EXISTS RobotsSpilled (id INT, spilledGen INT, releasedGen INT, info BLOB, "
+                         "PRIMARY KEY (id, spilledGen))")
+
+    def next_generation(self):
+        """
+        Starts a new generation and prunes the robots released more than history generations ago.
+        :return: None
+        """
+        self.generation += 1
+        self.cur.execute("DELETE FROM RobotsSpilled WHERE releasedGen <= ?", (self.generation - self.history,))
+
+    def put(self, robot_id, data):
+        """
+        :param robot_id: id of the robot.
+        :param data: The pickled robot.
+        :return: None
+        """
+        self.cur.execute("INSERT OR REPLACE INTO RobotsSpilled VALUES (?, ?, NULL, ?)",
+                         (int(robot_id), self.generation, data))
+        self.stored_bytes += len(data)
+
+    def get(self, robot_id, remove=True):
+        """
+        Loads a robot.
+        :param robot_id: id of the robot.
+        :param remove: If True, the robot is released from the store.
+        :return: The robot.
+        """
+        self.cur.execute("SELECT info FROM RobotsSpilled WHERE id = ? AND releasedGen IS NULL", (int(robot_id),))
+        data = self.cur.fetchone()[0]
+        if remove:
+            self.delete(robot_id, len(data))
+        return pickle.loads(data)
+
+    def delete(self, robot_id, numb_bytes=None):
+        """
+        Releases a robot. It stays in the database while an older checkpoint may still need it.
+        :param robot_id: id of the robot.
+        :param numb_bytes: Size of the stored robot, if known.
+        :return: None
+        """
+        if numb_bytes is None:
+            self.cur.execute("SELECT length(info) FROM RobotsSpilled WHERE id = ? AND releasedGen IS NULL",
+                             (int(robot_id),))
+            numb_bytes = self.cur.fetchone()[0]
+        # a robot spilled in this generation is in no checkpoint.
+        self.cur.execute("DELETE FROM RobotsSpilled WHERE id = ? AND spilledGen = ?", (int(robot_id), self.generation))
+        self.cur.execute("UPDATE RobotsSpilled SET releasedGen = ? WHERE id = ? AND releasedGen IS NULL",
+                         (self.generation, int(robot_id)))
+        self.stored_bytes -= numb_bytes
+
+    def live_ids(self):
+        """
+        :return: Set of the ids of the robots in the store at the end of generation.
+        """
+        self.cur.execute("SELECT id FROM RobotsSpilled WHERE spilledGen <= ? AND "
+                         "(releasedGen IS NULL OR releasedGen > ?)", (self.generation, self.generation))
+        return set(row[0] for row in self.cur.fetchall())
+
+    def rollback(self):
+        """
+        Restores the store to the end of generation, e.g. after loading an older checkpoint: robots spilled later are
+        removed and robots released later are put back.
+        :return: Number of rows changed.
+        """
+        self.cur.execute("DELETE FROM RobotsSpilled WHERE spilledGen > ?", (self.generation,))
+        numb_changed = self.cur.rowcount
+        self.cur.execute("UPDATE RobotsSpilled SET releasedGen = NULL WHERE releasedGen > ?", (self.generation,))
+        return numb_changed + self.cur.rowcount
@@ -0,0 +1,162 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+from collections import deque
+
+import numpy as np
+
+
+class MakespanScheduler(object):
+    """
+    Orders evaluations longest-first using measured evaluation times.
+    Workers take the next piece of work as soon as they are free, so submitting the longest jobs first gives the
+    longest-processing-time-first schedule across the cpu slots.
+    The makespan is only estimated when the number of slots of the evaluation backend is known.
+    """
+
+    def __init__(self, num_slots=None, history=500):
+        """
+        :param num_slots: Number of cpu slots the work is spread across. None if unknown, in which case work is still
+            ordered longest first but no makespan is estimated.
+        :param history: Number of recent evaluation times to remember.
+        """
+        self.num_slots = num_slots
+        self.recent_times = deque(maxlen=history)
+        self.last_predicted_makespan = None
+
+    def record(self, eval_times):
+        """
+        Remembers measured evaluation times.
+        :param eval_times: Seconds taken by each evaluation. NaN entries are ignored.
+        :return: None
+        """
+        self.recent_times.extend(t for t in eval_times if not np.isnan(t))
+
+    def default_cost(self):
+        """
+        :return: Predicted cost of a robot with no history. The median of the recent evaluation times, or 1.
+        """
+        if len(self.recent_times) == 0:
+            return 1.0
+        return float(np.median(self.recent_times))
+
+    def predict(self, own_times, parent_times):
+        """
+        Predicts the cost of each evaluation from the robot's own history, else from its parent's, else the default.
+        :param own_times: Last measured evaluation time of each robot. NaN if unknown.
+        :param parent_times: Last measured evaluation time of each robot's parent. NaN if unknown.
+        :return: numpy array of predicted seconds.
+        """
+        own_times = np.asarray(own_times, dtype=np.float64)
+        parent_times = np.asarray(parent_times, dtype=np.float64)
+        predicted = np.where(np.isnan(own_times), parent_times, own_times)
+        return np.where(np.isnan(predicted), self.default_cost(), predicted)
+
+    def order(self, predicted, cpus):
+        """
+        :param predicted: Predicted seconds of each evaluation.
+        :param cpus: Cpus requested by each evaluation.
+        :return: Indices of the evaluations, longest first. Ties go to the evaluation requesting more cpus.
+        """
+        return np.lexsort((-np.asarray(cpus), -np.asarray(predicted)))
+
+    def estimate_makespan(self, predicted, cpus):
+        """
+        Simulates submitting the evaluations in the given order to num_slots cpu slots.
+        An evaluation requesting k cpus starts once k slots are free.
+        :param predicted: Predicted seconds of each evaluation, in submission order.
+        :param cpus: Cpus requested by each evaluation, in submission order.
+        :return: Predicted seconds until every evaluation is done. None if num_slots is unknown.
+        """
+        if self.num_slots is None:
+            self.last_predicted_makespan = None
+            return None
+        slots = [0.0] * self.num_slots
+        makespan = 0.0
+        for cost, k in zip(predicted, cpus):
+            k = int(min(max(k, 1), self.num_slots))
+            taken = [heapq.heappop(slots) for _ in range(k)]
+            end = taken[-1] + cost
+            for _ in range(k):
+                heapq.heappush(slots, end)
+            makespan = max(makespan, end)
+        self.last_predicted_makespan = makespan
+        return makespan
+
+
+class EvaluationDeadlines(object):
+    """
+    Decides how long each evaluation may take and what happens to robots which take longer.
+    Unless a fixed timeout is given, the deadline is factor times the larger of the quantile of the recent evaluation
+    times and the robot's own predicted cost, but at least min_timeout. No deadline is set until min_samples
+    evaluations have been timed.
+    Deadlines are enforced on the worker with SIGALRM (see TimedWork). Only the local PoolEvaluator also abandons work
+    past its deadline from the master and runs speculative copies of stragglers; with parallelpy (e.g. over MPI) an
+    evaluation which can not be interrupted on its worker blocks the generation, and straggler_after is ignored.
+    """
+    FALLBACKS = ("reevaluate", "worst")
+
+    def __init__(self, timeout=None, quantile=0.95, factor=3.0, min_samples=20, straggler_factor=2.0,
+                 fallback="reevaluate", max_retries=2, min_timeout=1.0):
+        """
+        :param timeout: Fixed deadline in seconds. If None, it is derived from the recent evaluation times.
+        :param quantile: Quantile of the recent evaluation times the deadline is based on.
+        :param factor: Multiple of that quantile (or of the predicted cost) an evaluation may take.
+        :param min_samples: Number of timed evaluations needed before deadlines are derived.
+        :param straggler_factor: Multiple of its predicted cost after which an evaluation is a straggler.
+        :param fallback: What to do with a robot which timed out.
+            "reevaluate": it can not be removed this generation and is evaluated again next generation.
+            "worst": it is dominated by every evaluated robot.
+        :param max_retries: Number of consecutive time outs after which "reevaluate" becomes "worst".
+        :param min_timeout: Shortest derived deadline in seconds, so that very fast evaluations are not timed out by
+            scheduling noise.
+        """
+        assert fallback in self.FALLBACKS, "fallback must be one of %s" % (self.FALLBACKS,)
+        self.timeout = timeout
+        self.quantile = quantile
+        self.factor = factor
+        self.min_samples = min_samples
+        self.straggler_factor = straggler_factor
+        self.fallback = fallback
+        self.max_retries = max_retries
+        self.min_timeout = min_timeout
+
+    def deadline(self, recent_times, predicted):
+        """
+        :param recent_times: Recently measured evaluation times.
+        :param predicted: Predicted seconds of the evaluation.
+        :return: Seconds the evaluation may take. None for no limit.
+        """
+        if self.timeout is not None:
+            return self.timeout
+        if len(recent_times) < self.min_samples:
+            return None
+        return max(self.min_timeout, self.factor * max(float(np.quantile(recent_times, self.quantile)), predicted))
+
+    def straggler_after(self, predicted):
+        """
+        :param predicted: Predicted seconds of the evaluation.
+        :return: Seconds after which the evaluation is considered a straggler.
+        """
+        return self.straggler_factor * predicted
+
+    def split_timed_out(self, timeouts):
+        """
+        :param timeouts: Number of consecutive time outs of each student.
+        :return: (worst, protected) boolean masks of the students to treat as worst, and to keep without selection.
+        """
+        timed_out = timeouts > 0
+        worst = timed_out & ((self.fallback == "worst") | (timeouts > self.max_retries))
+        return worst, timed_out & ~worst
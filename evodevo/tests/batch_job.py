@@ -0,0 +1,63 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+from functools import partial
+
+from evodevo.batch_run import BatchEvolutionaryRun
+from evodevo.evo_run import EvolutionaryRun
+
+from parallelpy import parallel_evaluate
+import numpy as np
+
+sys.path.insert(0, "../..")
+
+from evodevo.tests.softbot_robot_base import SoftbotRobot
+
+parallel_evaluate.MAX_THREADS = 24
+# parallel_evaluate.DEBUG=True
+
+# check if we are running on the VACC. if so. disable debug mode.
+if os.getenv("VACC") is not None:
+    parallel_evaluate.DEBUG = False
+    parallel_evaluate.MAX_THREADS = 24
+
+np.set_printoptions(suppress=True, formatter={'float_kind': lambda x: '%4.2f' % x})
+
+
+POP_SIZE = 10
+MAX_GENS = 90
+
+# usage: python batch_job.py FIRST_SEED NUM_SEEDS MAX_RUNTIME
+FIRST_SEED = int(sys.argv[1])
+NUM_SEEDS = int(sys.argv[2])
+MAX_RUNTIME = float(sys.argv[3])
+RUN_NAME = "CiliaSwimmers"
+
+parallel_evaluate.setup(parallel_evaluate.PARALLEL_MODE_MPI_INTER)  # need to do this AFTER all classes have been defined; or MPI will not work. Pool will though...
+
+
+def create_new_job(seed):
+    # the factory is pickled with the checkpoints, so it can not be a closure.
+    robot_factory = partial(SoftbotRobot, None, "run_%d" % seed)
+
+    # each run seeds its own selection, immigrant and offspring random number streams from its seed.
+    return EvolutionaryRun(robot_factory, MAX_GENS, seed, pop_size=POP_SIZE,
+                           experiment_name=RUN_NAME, override_git_hash_change=True, max_time=MAX_RUNTIME)
+
+
+# all of the runs share the MPI workers.
+batch_run = BatchEvolutionaryRun([create_new_job(seed) for seed in range(FIRST_SEED, FIRST_SEED + NUM_SEEDS)])
+batch_run.run_full(printing=True)
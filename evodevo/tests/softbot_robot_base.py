@@ -55,6 +55,10 @@ class SoftbotRobot(MOORobotInterface):
     def iterate_generation(self):
         self.age += 1
 
+    def get_generation_drift(self):
+        # iterate_generation only increases the age, which is the only minimized objective.
+        return [1], [0]
+
     def needs_evaluation(self):
         return self.needs_eval
 
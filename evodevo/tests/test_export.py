@@ -0,0 +1,113 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+
+from evodevo.export import ColumnarExporter, load_generation_index, load_table, resize_npy
+
+
+class ResizeNpyTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "a.npy")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_creates_and_appends(self):
+        self.assertEqual(resize_npy(self.path, 0), 0)
+        self.assertEqual(resize_npy(self.path, 0, np.array([[1, 2], [3, 4]])), 2)
+        self.assertEqual(resize_npy(self.path, 2, np.array([[5, 6]])), 3)
+        np.testing.assert_array_equal(np.load(self.path), [[1, 2], [3, 4], [5, 6]])
+
+    def test_truncates(self):
+        np.save(self.path, np.arange(5))
+        self.assertEqual(resize_npy(self.path, 2), 2)
+        np.testing.assert_array_equal(np.load(self.path), [0, 1])
+        # keeping more rows than the file has keeps all of them.
+        self.assertEqual(resize_npy(self.path, 10), 2)
+        np.testing.assert_array_equal(np.load(self.path), [0, 1])
+
+    def test_replaces_rows_of_the_same_length(self):
+        np.save(self.path, np.array([[1, 2, 3], [4, 5, 6]]))
+        self.assertEqual(resize_npy(self.path, 1, np.array([[2, 10, 20]])), 2)
+        np.testing.assert_array_equal(np.load(self.path), [[1, 2, 3], [2, 10, 20]])
+
+    def test_grows_the_shape_in_the_header(self):
+        big = np.zeros((10 ** 6, 3), dtype=np.int8)
+        np.save(self.path, big[:1])
+        self.assertEqual(resize_npy(self.path, 1, big[1:]), len(big))
+        self.assertEqual(np.load(self.path, mmap_mode="r").shape, big.shape)
+
+
+class ColumnarExporterTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.con = sqlite3.connect(os.path.join(self.dir, "database.db"))
+        self.cur = self.con.cursor()
+        self.cur.execute("CREATE TABLE Robots (id INT, parentId INT, fitnessTrain FLOAT, name TEXT)")
+        self.cur.execute("CREATE TABLE RobotsEval (id INT, generation INT, evalTime FLOAT)")
+        self.exporter = ColumnarExporter(self.dir)
+        self.out_dir = os.path.join(self.dir, "columns")
+
+    def tearDown(self):
+        self.con.close()
+        shutil.rmtree(self.dir)
+
+    def save(self, robot_ids, generation):
+        for robot_id in robot_ids:
+            self.cur.execute("INSERT INTO Robots VALUES (?, ?, ?, ?)",
+                             (robot_id, robot_id - 1, robot_id / 10.0, "robot %d" % robot_id))
+            self.cur.execute("INSERT INTO RobotsEval VALUES (?, ?, ?)", (robot_id, generation, 0.5))
+
+    def test_generation_continues_across_exports(self):
+        self.save([1, 2, 3], 0)
+        self.assertEqual(self.exporter.export(self.cur), 3)
+        self.save([4, 5], 0)
+        self.save([6], 1)
+        self.assertEqual(self.exporter.export(self.cur), 3)
+        np.testing.assert_array_equal(load_generation_index(self.out_dir), [[0, 0, 5], [1, 5, 6]])
+        self.assertEqual(self.exporter.export(self.cur), 0)
+        np.testing.assert_array_equal(load_generation_index(self.out_dir), [[0, 0, 5], [1, 5, 6]])
+
+    def test_truncate(self):
+        self.save([1, 2], 0)
+        self.save([3, 4], 1)
+        self.save([5, 6], 2)
+        self.exporter.export(self.cur)
+
+        # the run resumed from the checkpoint of generation 1, which was written after robot 3 was saved.
+        self.exporter.truncate(3, 1)
+        robots = load_table(self.out_dir, "Robots")
+        np.testing.assert_array_equal(robots["id"], [1, 2, 3])
+        self.assertEqual(robots["name"][-1], "robot 3")
+        np.testing.assert_array_equal(load_generation_index(self.out_dir), [[0, 0, 2], [1, 2, 3]])
+
+        self.cur.execute("DELETE FROM Robots WHERE id > 3")
+        self.cur.execute("DELETE FROM RobotsEval WHERE id > 3")
+        self.save([4], 1)
+        self.save([7], 2)
+        self.exporter.export(self.cur)
+        np.testing.assert_array_equal(load_table(self.out_dir, "RobotsEval")["id"], [1, 2, 3, 4, 7])
+        np.testing.assert_array_equal(load_generation_index(self.out_dir), [[0, 0, 2], [1, 2, 4], [2, 4, 5]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import unittest
+
+import numpy as np
+
+from evodevo.metrics import hypervolume, hypervolume_2d
+
+
+def grid_hypervolume(points, reference):
+    # counts the unit cells of the integer grid below reference which some point dominates.
+    points = np.asarray(points).reshape(-1, len(reference))
+    volume = 0
+    for cell in itertools.product(*[range(r) for r in reference]):
+        if np.any(np.all(points <= cell, axis=1)):
+            volume += 1
+    return volume
+
+
+class HypervolumeTest(unittest.TestCase):
+    def test_2d_staircase(self):
+        points = [[1, 3], [2, 2], [3, 1]]
+        self.assertAlmostEqual(hypervolume_2d(points, [4, 4]), 6.0)
+        self.assertAlmostEqual(hypervolume(points, [4, 4]), 6.0)
+
+    def test_2d_dominated_and_duplicate_points_add_nothing(self):
+        points = [[1, 3], [2, 2], [3, 1], [3, 3], [2, 2], [1, 3.5]]
+        self.assertAlmostEqual(hypervolume(points, [4, 4]), 6.0)
+
+    def test_points_outside_the_reference_are_ignored(self):
+        # points on the boundary of the reference do not strictly dominate it either.
+        self.assertAlmostEqual(hypervolume([[2, 2], [5, 0], [4, 1], [0, 4]], [4, 4]), 4.0)
+        self.assertAlmostEqual(hypervolume([[1, 1, 1], [0, 0, 3]], [2, 2, 3]), 2.0)
+        self.assertEqual(hypervolume([[5, 5]], [4, 4]), 0.0)
+
+    def test_empty_front(self):
+        self.assertEqual(hypervolume(np.zeros((0, 2)), [1, 1]), 0.0)
+        self.assertEqual(hypervolume_2d(np.zeros((0, 2)), [1, 1]), 0.0)
+        self.assertEqual(hypervolume(np.zeros((0, 3)), [1, 1, 1]), 0.0)
+
+    def test_1d(self):
+        self.assertAlmostEqual(hypervolume([[2], [3]], [5]), 3.0)
+
+    def test_3d_known_volumes(self):
+        self.assertAlmostEqual(hypervolume([[1, 1, 1]], [2, 3, 4]), 6.0)
+        # two boxes of 4 and 2 which overlap in a unit cube.
+        self.assertAlmostEqual(hypervolume([[0, 0, 1], [1, 1, 0]], [2, 2, 2]), 5.0)
+
+    def test_matches_grid_count(self):
+        rng = np.random.default_rng(0)
+        for reference in ([5, 5], [4, 4, 4], [3, 4, 3, 3]):
+            for n in (1, 3, 8):
+                points = rng.integers(0, 5, size=(n, len(reference)))
+                self.assertAlmostEqual(hypervolume(points, reference), grid_hypervolume(points, reference))
+
+
+if __name__ == "__main__":
+    unittest.main()
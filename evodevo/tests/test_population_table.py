@@ -0,0 +1,122 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import numpy as np
+
+try:
+    from evodevo.moo_interfaces import MOORobotInterface
+    from evodevo.population_table import PopulationTable
+    ParallelPyMissing = False
+except ImportError:
+    ParallelPyMissing = True
+
+if not ParallelPyMissing:
+    class TableRobot(MOORobotInterface):
+        def __init__(self, robot_id, seq_num, minimize_vals, maximize_vals):
+            self.id = robot_id
+            self.seq_num = seq_num
+            self.minimize_vals = list(minimize_vals)
+            self.maximize_vals = list(maximize_vals)
+
+        def set_id(self, new_id):
+            self.id = new_id
+
+        def get_id(self):
+            return self.id
+
+        def get_seq_num(self):
+            return self.seq_num
+
+        def get_minimize_vals(self):
+            return self.minimize_vals
+
+        def get_maximize_vals(self):
+            return self.maximize_vals
+
+        def get_fitness(self):
+            return self.maximize_vals[0] if self.maximize_vals else 0.0
+
+        def needs_evaluation(self):
+            return False
+
+        def iterate_generation(self):
+            pass
+
+        def mutate(self):
+            pass
+
+        def get_summary_sql_data(self):
+            return None
+
+        def get_description_sql_columns(self):
+            return None
+
+        def dominates_final_selection(self, other):
+            return self.get_fitness() > other.get_fitness()
+
+
+@unittest.skipIf(ParallelPyMissing, "parallelpy is needed for the robot interfaces.")
+class DominanceMatrixTest(unittest.TestCase):
+    def random_population(self, rng, n, numb_min, numb_max):
+        # few distinct values, so many robots tie on some or all objectives. Some sequence numbers repeat as well.
+        seq_nums = rng.integers(0, n, size=n)
+        return [TableRobot(i + 1, int(seq_nums[i]), rng.integers(0, 3, size=numb_min),
+                           rng.integers(0, 3, size=numb_max)) for i in range(n)]
+
+    def table(self, robots):
+        table = PopulationTable()
+        table.append(robots, [-1] * len(robots), [0] * len(robots))
+        self.assertTrue(table.vectorized)
+        return table
+
+    def expected(self, robots):
+        return np.array([[a.dominates(b) for b in robots] for a in robots])
+
+    def test_matches_dominates(self):
+        rng = np.random.default_rng(0)
+        for numb_min, numb_max in ((1, 1), (2, 0), (0, 2), (2, 3)):
+            for n in (1, 2, 10, 40):
+                robots = self.random_population(rng, n, numb_min, numb_max)
+                np.testing.assert_array_equal(self.table(robots).dominance_matrix(robots), self.expected(robots))
+
+    def test_identical_objectives_break_ties_by_sequence_number(self):
+        robots = [TableRobot(1, 5, [1], [2]), TableRobot(2, 3, [1], [2]), TableRobot(3, 3, [1], [2])]
+        np.testing.assert_array_equal(self.table(robots).dominance_matrix(robots),
+                                      [[False, False, False], [True, False, False], [True, False, False]])
+
+    def test_worst_and_protected(self):
+        rng = np.random.default_rng(1)
+        n = 30
+        robots = self.random_population(rng, n, 1, 1)
+        table = self.table(robots)
+        for _ in range(20):
+            worst = rng.random(n) < 0.2
+            protected = (rng.random(n) < 0.2) & ~worst
+
+            expected = self.expected(robots)
+            for i in range(n):
+                for j in range(n):
+                    if protected[i] or protected[j]:
+                        expected[i, j] = False
+                    elif worst[i]:
+                        expected[i, j] = False
+                    elif worst[j]:
+                        expected[i, j] = True
+            np.testing.assert_array_equal(table.dominance_matrix(robots, worst=worst, protected=protected), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
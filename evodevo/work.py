@@ -0,0 +1,136 @@
+# Copyright 2019 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import signal
+import threading
+import time
+
+from parallelpy.utils import Work, Letter
+
+from evodevo.rng import seeded
+
+
+def make_child(parent, child_id, seed_sequence):
+    """
+    Clones and mutates parent. The global random number generators are seeded from seed_sequence while mutating,
+    so the same child is produced no matter which process does the work.
+    :param parent: The robot to copy.
+    :param child_id: The id to give the child.
+    :param seed_sequence: numpy SeedSequence of the child. See RNGStreams.offspring_seed_sequence
+    :return: The new robot.
+    """
+    with seeded(seed_sequence):
+        child = copy.deepcopy(parent)
+        child.mutate()
+    child.set_id(child_id)
+    return child
+
+
+class ReproductionWork(Work):
+    """
+    Creates and evaluates a child on a worker.
+    The master only sends the parent, the id of the child and the SeedSequence to mutate with. The worker clones,
+    mutates and evaluates the child and sends the finished child back.
+    Every ReproductionWork carries its own copy of the parent, so a parent chosen for k children is pickled and sent k
+    times, and each child comes back whole. This only pays off when evaluating a robot costs much more than pickling
+    one.
+    """
+
+    def __init__(self, parent, child_id, seed_sequence):
+        self.parent = parent
+        self.child_id = child_id
+        self.seed_sequence = seed_sequence
+        self.child = None
+
+    def cpus_requested(self):
+        return self.parent.cpus_requested()
+
+    def compute_work(self, **kwargs):
+        self.child = make_child(self.parent, self.child_id, self.seed_sequence)
+        if self.child.get_num_eval_stages() > 1:
+            self.child.set_eval_stage(0)
+        if self.child.needs_evaluation():
+            self.child.compute_work(**kwargs)
+
+    def write_letter(self):
+        child_letter = self.child.write_letter() if self.child.needs_evaluation() else None
+        return Letter((self.child, child_letter), None)
+
+    def open_letter(self, letter):
+        self.child, child_letter = letter.get_data()
+        if child_letter is not None:
+            self.child.open_letter(child_letter)
+        self.parent = None
+
+
+class EvaluationTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise EvaluationTimeout()
+
+
+class TimedWork(Work):
+    """
+    Measures how long the wrapped work takes to compute on the worker.
+    If timeout is set, the computation is interrupted with SIGALRM once it runs for longer than timeout seconds.
+    This is only possible on platforms with signal.setitimer when running in the main thread; elsewhere the deadline is
+    left to the evaluator (see PoolEvaluator).
+    """
+
+    def __init__(self, work, predicted=None, timeout=None, straggler_after=None):
+        """
+        :param work: The Work to compute.
+        :param predicted: Predicted seconds the work will take. Used to order work from several sources.
+        :param timeout: Seconds the work may take before it is given up on. None for no limit.
+        :param straggler_after: Seconds after which an evaluator may submit a speculative duplicate. None to never.
+        """
+        self.work = work
+        self.predicted = predicted
+        self.timeout = timeout
+        self.straggler_after = straggler_after
+        self.eval_time = float("nan")
+        self.timed_out = False
+
+    def cpus_requested(self):
+        return self.work.cpus_requested()
+
+    def compute_work(self, **kwargs):
+        use_alarm = self.timeout is not None and hasattr(signal, "setitimer") and \
+                    threading.current_thread() is threading.main_thread()
+        if use_alarm:
+            previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+            signal.setitimer(signal.ITIMER_REAL, self.timeout)
+        t0 = time.time()
+        try:
+            try:
+                self.work.compute_work(**kwargs)
+            finally:
+                if use_alarm:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+                    signal.signal(signal.SIGALRM, previous_handler)
+        except EvaluationTimeout:
+            self.timed_out = True
+        self.eval_time = time.time() - t0
+
+    def write_letter(self):
+        work_letter = None if self.timed_out else self.work.write_letter()
+        return Letter((work_letter, self.eval_time, self.timed_out), None)
+
+    def open_letter(self, letter):
+        work_letter, self.eval_time, self.timed_out = letter.get_data()
+        if not self.timed_out:
+            self.work.open_letter(work_letter)